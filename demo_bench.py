@@ -0,0 +1,476 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import re
+import resource
+import runpy
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from demo_io import CHUNKED_FORMATS
+
+
+# =========================================================
+# BENCHMARK SUITE
+#
+# Generates synthetic Combined_Long, Weights_Long and Proximity inputs
+# at a given scale (securities × metrics × dates), runs the pipeline
+# stages on them (the rebase scripts themselves, see STAGES) and writes
+# one JSON record per run:
+#
+#   python demo_bench.py --securities 500 --metrics 6 --dates 750 -o bench.json
+#
+# Every stage runs in a fresh (spawned) process, so its peak RSS and
+# I/O counters are its own. Measured per stage:
+#   - wall_s:       wall-clock seconds (best of --repeat runs)
+#   - cpu_s:        user + system CPU seconds
+#   - peak_rss_mb:  ru_maxrss of the stage process
+#   - base_rss_mb:  ru_maxrss before the stage ran (interpreter + imports)
+#   - read_bytes / write_bytes: rchar / wchar of /proc/self/io, i.e.
+#     bytes through read()/write() calls. Pages of memory-mapped files
+#     (feather cache, proximity store) are not counted.
+#
+# Generated inputs are kept under WORKDIR/data and reused by later runs
+# at the same scale. Nothing is downloaded; Linux only (/proc, rusage).
+# =========================================================
+
+WORKDIR = "bench"
+REAL_END = "2025-10-31"
+DEMO_END = "2025-11-17"
+SEED = 0
+
+# Excel sheets hold 1,048,576 rows: the Proximity workbook gets as many
+# securities as fit
+XLSX_MAX_ROWS = 1_048_575
+PROXIMITY_GROUPS = ["DIVYILD", "SIZE", "SpeRisk"]
+
+METRIC_LEVELS = ["Overall", "Sub1", "Sub2"]
+METRIC_FACTORS = ["Quality", "Value", "Momentum", "Growth", "Sentiment", "Risk"]
+
+
+# =========================================================
+# SYNTHETIC INPUTS
+# =========================================================
+def _metrics(n):
+    """
+    n (Metric, Metric_Level1, Metric_Level2) triples.
+    """
+    triples = [("Alpha", factor, level) for factor in METRIC_FACTORS for level in METRIC_LEVELS]
+    triples += [("Score", f"F{i}", "Overall") for i in range(max(0, n - len(triples)))]
+    return triples[:n]
+
+
+def _securities(n):
+    ids = np.array([f"USA{i:05d}" for i in range(n)])
+    names = np.array([f"COMPANY {i} INC" for i in range(n)], dtype=object)
+    # The confirmation step of the alphas rebase looks for these
+    for i, name in enumerate(["TESLA INC", "NVIDIA CORP"][:n]):
+        names[i] = name
+    return ids, names
+
+
+def generate(data_dir, securities, metrics, dates, real_end=REAL_END, seed=SEED):
+    """
+    Write the three synthetic inputs to data_dir (skipped when they
+    already exist) and return {"combined", "weights", "proximity"} paths.
+
+    Dates are the last `dates` weekdays up to real_end; Combined_Long has
+    one row per security, date and metric, Weights_Long one per security
+    and date, Proximity one per security, date and ContextualVarGroup.
+    """
+    paths = {
+        "combined": os.path.join(data_dir, "Combined_Long.csv.gz"),
+        "weights": os.path.join(data_dir, "Weights_Long.csv.gz"),
+        "proximity": os.path.join(data_dir, "Proximity Data.xlsx"),
+    }
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+    os.makedirs(data_dir, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=real_end, periods=dates)
+    day_text = np.array(days.strftime("%Y-%m-%d"), dtype=object)
+    ids, names = _securities(securities)
+    triples = np.array(_metrics(metrics), dtype=object)
+
+    # ---------- Combined_Long: security × date × metric ----------
+    print(f"Generating Combined_Long ({securities * dates * metrics:,} rows)")
+    s = np.repeat(np.arange(securities), dates * metrics)
+    d = np.tile(np.repeat(np.arange(dates), metrics), securities)
+    m = np.tile(np.arange(metrics), securities * dates)
+    pd.DataFrame({
+        "BarraId": ids[s],
+        "SECURITY_NAME": names[s],
+        "Date": day_text[d],
+        "Metric": triples[m, 0],
+        "Metric_Level1": triples[m, 1],
+        "Metric_Level2": triples[m, 2],
+        "Value": rng.standard_normal(len(s)).round(6),
+    }).to_csv(paths["combined"], index=False, compression="gzip")
+
+    # ---------- Weights_Long: security × date ----------
+    print(f"Generating Weights_Long ({securities * dates:,} rows)")
+    s = np.repeat(np.arange(securities), dates)
+    d = np.tile(np.arange(dates), securities)
+    pd.DataFrame({
+        "BarraId": ids[s],
+        "SECURITY_NAME": names[s],
+        "Date": day_text[d],
+        "Weight": rng.dirichlet(np.ones(securities), dates).T.ravel().round(8),
+    }).to_csv(paths["weights"], index=False, compression="gzip")
+
+    # ---------- Proximity: security × date × group (xlsx) ----------
+    groups = np.array(PROXIMITY_GROUPS)
+    n_prox = min(securities, XLSX_MAX_ROWS // (dates * len(groups)))
+    print(f"Generating Proximity ({n_prox * dates * len(groups):,} rows, "
+          f"{n_prox:,} securities)")
+    s = np.repeat(np.arange(n_prox), dates * len(groups))
+    d = np.tile(np.repeat(np.arange(dates), len(groups)), n_prox)
+    g = np.tile(np.arange(len(groups)), n_prox * dates)
+    pd.DataFrame({
+        "BarraId": ids[s],
+        "Date": days[d],
+        "ContextualVarGroup": groups[g],
+        "value": rng.standard_normal(len(s)).round(4),
+    }).to_excel(paths["proximity"], index=False, engine="xlsxwriter")
+
+    return paths
+
+
+# =========================================================
+# STAGES
+#
+# Each stage is stage(inputs, out_dir, options) → {"rows": ...} and
+# reads what the earlier stages wrote to out_dir.
+#
+# The rebase stages run the rebase scripts themselves: a copy of the
+# script with its CONFIGURATION lines replaced (run_script), executed
+# in out_dir/<stage>. Every step of the scripts (confirmation exports,
+# target selection, ex-post report) is measured, and the script's own
+# run log adds a per-step breakdown under "steps".
+# =========================================================
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def patch_config(text, settings):
+    """
+    Script source with each `NAME = ...` line of settings replaced by
+    `NAME = <settings[NAME]>` (a Python expression). Raises ValueError
+    when the script has no such setting.
+    """
+    for name, value in settings.items():
+        text, n = re.subn(rf"^{name} = .*$", lambda _: f"{name} = {value}", text,
+                          count=1, flags=re.MULTILINE)
+        if not n:
+            raise ValueError(f"no {name} setting to patch")
+    return text
+
+
+def run_script(script, work_dir, settings):
+    """
+    Run a copy of script (from this directory) with settings patched
+    in, as __main__, with work_dir as the working directory (where the
+    scripts write their outputs). work_dir is emptied first.
+    """
+    work_dir = os.path.abspath(work_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    with open(os.path.join(REPO_DIR, script)) as fh:
+        text = patch_config(fh.read(), settings)
+    path = os.path.join(work_dir, script)
+    with open(path, "w") as fh:
+        fh.write(text)
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        runpy.run_path(path, run_name="__main__")
+    finally:
+        os.chdir(cwd)
+
+
+def _script_steps(work_dir):
+    """
+    Rows exported and wall seconds per top-level step, from the run log
+    the script wrote to work_dir.
+    """
+    (path,) = glob.glob(os.path.join(work_dir, "*_RUNLOG_*.json"))
+    with open(path) as fh:
+        records = [r for r in json.load(fh)["stages"] if r["depth"] == 0]
+    return {
+        "rows": max((r["rows"] or 0 for r in records), default=0),
+        "steps": {r["stage"]: r["wall_s"] for r in records},
+    }
+
+
+def _rebase_script(name, script, path, out_dir, options, **settings):
+    work_dir = os.path.join(out_dir, name)
+    run_script(script, work_dir, {
+        "INPUT_PATH": repr(os.path.abspath(path)),
+        "REAL_END": f"pd.Timestamp({REAL_END!r})",
+        "DEMO_END": f"pd.Timestamp({DEMO_END!r})",
+        "DEMO_CALENDAR": repr(options["calendar"]),
+        "EXPORT_FORMAT": repr(options["format"]),
+        "GZIP_WORKERS": repr(options["workers"]),
+        "INPUT_CACHE": "False",             # measure the parse, not a cache hit
+        **settings,
+    })
+    return _script_steps(work_dir)
+
+
+def _stage_export(out_dir, stage, options):
+    """
+    The demo export a rebase stage wrote.
+    """
+    (path,) = glob.glob(os.path.join(out_dir, stage, f"Global_LC_*_DEMO_ending_*.{options['format']}"))
+    return path
+
+
+def stage_rebase_alphas(inputs, out_dir, options):
+    return _rebase_script("rebase_alphas", "rebase_alphas_to_demo_date.py", inputs["combined"],
+                          out_dir, options, STREAMING="False", CHUNK_SIZE=repr(options["chunksize"]))
+
+
+def stage_rebase_alphas_streaming(inputs, out_dir, options):
+    return _rebase_script("rebase_alphas_streaming", "rebase_alphas_to_demo_date.py",
+                          inputs["combined"], out_dir, options,
+                          STREAMING="True", CHUNK_SIZE=repr(options["chunksize"]))
+
+
+def stage_rebase_weights(inputs, out_dir, options):
+    return _rebase_script("rebase_weights", "rebase_weights_to_demodate.py", inputs["weights"],
+                          out_dir, options)
+
+
+def stage_proximity_store(inputs, out_dir, options):
+    from demo_proximity import ProximityStore, convert_proximity
+
+    store = convert_proximity(inputs["proximity"])
+    return {"rows": ProximityStore(store).table.num_rows}
+
+
+def stage_expost(inputs, out_dir, options):
+    """
+    Per-date scans (uncached) and ex-post checks of the three exports.
+    The results are pickled for the dashboard stage.
+    """
+    from demo_calendar import load_holidays
+    from ex_post_date_validations_alpha_wgts_prox import build_expost_from_dates, date_counts
+
+    holidays = load_holidays(options["calendar"])
+    sources = [
+        (_stage_export(out_dir, "rebase_alphas", options), "Combined"),
+        (_stage_export(out_dir, "rebase_weights", options), "Weights"),
+        (inputs["proximity"], "Proximity"),
+    ]
+    results = []
+    for path, prefix in sources:
+        counts = date_counts(path, options["chunksize"])
+        results.append(build_expost_from_dates(counts["Date"].tolist(), prefix,
+                                               int(counts["Rows"].sum()), holidays))
+
+    with open(os.path.join(out_dir, "expost_results.pkl"), "wb") as fh:
+        pickle.dump(results, fh)
+    return {"rows": sum(r["rows"] for r in results)}
+
+
+def stage_dashboard(inputs, out_dir, options):
+    from ex_post_date_validations_alpha_wgts_prox import build_dashboard
+
+    with open(os.path.join(out_dir, "expost_results.pkl"), "rb") as fh:
+        results = pickle.load(fh)
+    build_dashboard(results, out_dir)
+    return {"rows": sum(len(r["mapping"]) for r in results)}
+
+
+# In run order; a stage may need the outputs of the ones before it
+STAGES = {
+    "rebase_alphas": stage_rebase_alphas,
+    "rebase_alphas_streaming": stage_rebase_alphas_streaming,
+    "rebase_weights": stage_rebase_weights,
+    "proximity_store": stage_proximity_store,
+    "expost": stage_expost,
+    "dashboard": stage_dashboard,
+}
+
+# Stages that stream their export through chunk_writer (CHUNKED_FORMATS only)
+CHUNKED_STAGES = ("rebase_alphas_streaming",)
+
+
+# =========================================================
+# MEASUREMENT
+# =========================================================
+def _io_counters():
+    """
+    rchar / wchar of this process, or None where /proc/self/io is missing.
+    """
+    try:
+        with open("/proc/self/io") as fh:
+            fields = dict(line.split(":", 1) for line in fh)
+    except OSError:
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_stage(name, inputs, out_dir, options):
+    """
+    Stage-process entry point: run one stage and return its measurements.
+    The stage's own progress output is discarded unless options["verbose"].
+    """
+    stage = STAGES[name]
+
+    # Imports are not part of any stage
+    import pyarrow  # noqa: F401
+    import ex_post_date_validations_alpha_wgts_prox  # noqa: F401
+    import demo_rebase, demo_verify  # noqa: F401,E401
+
+    base_rss = _peak_rss_mb()
+    io_before = _io_counters()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+
+    if options["verbose"]:
+        info = stage(inputs, out_dir, options)
+    else:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            info = stage(inputs, out_dir, options)
+
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    io_after = _io_counters()
+
+    return {
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "base_rss_mb": round(base_rss, 1),
+        "read_bytes": io_after[0] - io_before[0] if io_before else None,
+        "write_bytes": io_after[1] - io_before[1] if io_before else None,
+        **info,
+    }
+
+
+def run_stage(name, inputs, out_dir, options):
+    """
+    measure_stage in a new spawned process, so RSS and I/O start clean.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(measure_stage, name, inputs, out_dir, options).result()
+
+
+def run_benchmark(securities, metrics, dates, stages=None, repeat=1, workdir=WORKDIR,
+                  export_format="csv.gz", calendar=None, chunksize=1_000_000,
+                  workers=1, verbose=False):
+    """
+    Generate (or reuse) the inputs at this scale, run the stages in order
+    `repeat` times and return the JSON-ready record. Per stage, the run
+    with the lowest wall time is reported, plus every run's wall time.
+    """
+    scale = f"{securities}x{metrics}x{dates}"
+    inputs = generate(os.path.join(workdir, "data", scale), securities, metrics, dates)
+    out_dir = os.path.join(workdir, "out", scale)
+    os.makedirs(out_dir, exist_ok=True)
+
+    options = {"format": export_format, "calendar": calendar, "chunksize": chunksize,
+               "workers": workers, "verbose": verbose}
+    if stages is None:
+        stages = [s for s in STAGES if export_format in CHUNKED_FORMATS or s not in CHUNKED_STAGES]
+        skipped = [s for s in STAGES if s not in stages]
+        if skipped:
+            print(f"Skipping {', '.join(skipped)}: no chunked {export_format} export")
+    else:
+        stages = [s for s in STAGES if s in stages]
+        unsupported = [s for s in stages if s in CHUNKED_STAGES and export_format not in CHUNKED_FORMATS]
+        if unsupported:
+            raise ValueError(f"{', '.join(unsupported)} cannot export {export_format}; "
+                             f"use one of {CHUNKED_FORMATS}")
+
+    runs = {name: [] for name in stages}
+    for i in range(repeat):
+        for name in stages:
+            result = run_stage(name, inputs, out_dir, options)
+            runs[name].append(result)
+            print(f"[{i + 1}/{repeat}] {name:<24} {result['wall_s']:>9.3f} s  "
+                  f"{result['peak_rss_mb']:>9.1f} MB peak")
+
+    results = {}
+    for name, stage_runs in runs.items():
+        best = min(stage_runs, key=lambda r: r["wall_s"])
+        results[name] = {**best, "wall_s_runs": [r["wall_s"] for r in stage_runs]}
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "scale": {"securities": securities, "metrics": metrics, "dates": dates},
+        "inputs": {key: {"path": path, "bytes": os.path.getsize(path)}
+                   for key, path in inputs.items()},
+        "options": {k: v for k, v in options.items() if k != "verbose"},
+        "repeat": repeat,
+        "platform": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": results,
+    }
+
+
+# =========================================================
+# COMMAND LINE
+# =========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the demo pipeline stages on synthetic inputs."
+    )
+    parser.add_argument("--securities", type=int, default=200)
+    parser.add_argument("--metrics", type=int, default=6)
+    parser.add_argument("--dates", type=int, default=500)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES),
+                        help="stages to run (default: all, in pipeline order)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workdir", default=WORKDIR,
+                        help=f"generated inputs and outputs (default: {WORKDIR})")
+    parser.add_argument("--format", default="csv.gz", choices=["csv.gz", "parquet", "feather"],
+                        help="export format of the rebase stages")
+    parser.add_argument("--calendar", default=None)
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=1, help="gzip compression workers")
+    parser.add_argument("-o", "--output", help="JSON file (default: print to stdout)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="show the stages' own progress output")
+    args = parser.parse_args(argv)
+
+    record = run_benchmark(args.securities, args.metrics, args.dates, args.stages,
+                           args.repeat, args.workdir, args.format, args.calendar,
+                           args.chunksize, args.workers, args.verbose)
+
+    text = json.dumps(record, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+        print(f"Benchmark results → {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
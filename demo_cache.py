@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+
+from demo_trace import traced
+
+
+# =========================================================
+# ON-DISK CACHE OF PARSED INPUTS
+#
+# A loader's result (a DataFrame) is stored as an uncompressed,
+# memory-mappable feather file, keyed by the hash of the input file's
+# contents, the loader and its read options. A repeated run over the
+# same input maps the cached table instead of decompressing and
+# parsing the csv again. Least recently used entries are evicted once
+# the cache grows past CACHE_MAX_BYTES.
+# =========================================================
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".demo_cache", "frames")
+CACHE_MAX_BYTES = 8 * 2**30
+
+# Bump when a loader changes what it returns, to drop every old entry
+CACHE_VERSION = 1
+
+_DIGESTS = "digests.json"
+_READ_BLOCK = 8 * 2**20
+
+
+def _digest_index():
+    try:
+        with open(os.path.join(CACHE_DIR, _DIGESTS)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def file_digest(path):
+    """
+    blake2b of the file contents. Remembered per (path, size, mtime), so
+    an unchanged file is hashed only once.
+    """
+    st = os.stat(path)
+    stamp = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+    index = _digest_index()
+    if stamp in index:
+        return index[stamp]
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(_READ_BLOCK), b""):
+            h.update(block)
+    digest = h.hexdigest()
+
+    # Several processes (or threads) may do this at once; the last writer wins
+    index = _digest_index()
+    index[stamp] = digest
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = os.path.join(CACHE_DIR, f"{_DIGESTS}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as fh:
+        json.dump(index, fh)
+    os.replace(tmp, os.path.join(CACHE_DIR, _DIGESTS))
+    return digest
+
+
+def cache_key(path, loader, options):
+    spec = json.dumps(
+        [CACHE_VERSION, file_digest(path), loader.__module__, loader.__qualname__, options],
+        sort_keys=True, default=repr
+    )
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:32]
+
+
+def evict(max_bytes=CACHE_MAX_BYTES, keep=None):
+    """
+    Delete least recently used entries until the cache fits max_bytes.
+    keep (a path) is never deleted.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".feather"):
+            path = os.path.join(CACHE_DIR, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+
+
+def clear_cache():
+    for name in os.listdir(CACHE_DIR) if os.path.isdir(CACHE_DIR) else []:
+        os.remove(os.path.join(CACHE_DIR, name))
+
+
+@traced(rows=len)
+def cached_frame(path, loader, max_bytes=CACHE_MAX_BYTES, **options):
+    """
+    loader(path, **options), memoized on disk. The returned frame has a
+    fresh RangeIndex and the same dtypes as the loader's.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    entry = os.path.join(CACHE_DIR, f"{cache_key(path, loader, options)}.feather")
+
+    if os.path.exists(entry):
+        os.utime(entry)                  # mtime marks last use (LRU)
+        print(f"Cache hit: {path}")
+        return feather.read_table(entry, memory_map=True).to_pandas()
+
+    df = loader(path, **options)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, entry)
+    evict(max_bytes, keep=entry)
+
+    return df
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import CustomBusinessDay
+
+
+# =========================================================
+# HOLIDAY-AWARE DEMO CALENDARS
+#
+# calendars/<name>.csv holds the complete holiday list of one region
+# ("US", ...) in a Date column; "#" lines are comments. No network.
+# Add a region only once its full list is known: a partial list passes
+# every missing holiday off as a business day.
+# A "# Covers: <first> to <last>" line gives the span the list is
+# complete for; a timeline outside it raises instead of silently
+# treating the uncovered years as weekends-only.
+# Demo business-day timelines built from them are cached on disk,
+# keyed by (calendar, end date, count, holiday-file hash).
+# =========================================================
+
+CALENDAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendars")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".demo_cache", "calendars")
+
+
+def calendar_path(calendar):
+    return os.path.join(CALENDAR_DIR, f"{calendar}.csv")
+
+
+def available_calendars():
+    if not os.path.isdir(CALENDAR_DIR):
+        return []
+    return sorted(f[:-4] for f in os.listdir(CALENDAR_DIR) if f.endswith(".csv"))
+
+
+def load_holidays(calendar):
+    """
+    Sorted unique holidays of a calendar as datetime64[D]. None means
+    weekends only (no holidays).
+    """
+    if calendar is None:
+        return np.array([], dtype="datetime64[D]")
+
+    path = calendar_path(calendar)
+    if not os.path.exists(path):
+        raise ValueError(
+            f"Unknown calendar {calendar!r}: no {path} "
+            f"(available: {', '.join(available_calendars()) or 'none'})"
+        )
+
+    dates = pd.read_csv(path, comment="#", usecols=["Date"])["Date"]
+    return np.unique(pd.to_datetime(dates).to_numpy(dtype="datetime64[D]"))
+
+
+_COVERS = re.compile(r"^#\s*covers:\s*(\S+)\s+to\s+(\S+)", re.IGNORECASE)
+
+
+def calendar_coverage(calendar):
+    """
+    (first, last) day the holidays of a calendar are listed for: its
+    "# Covers:" line, else the whole years of its first and last
+    holiday. None for calendar=None (weekends only, no limit).
+    """
+    if calendar is None:
+        return None
+
+    with open(calendar_path(calendar)) as fh:
+        for line in fh:
+            match = _COVERS.match(line.strip())
+            if match:
+                return pd.Timestamp(match.group(1)), pd.Timestamp(match.group(2))
+
+    holidays = load_holidays(calendar)
+    if not len(holidays):
+        raise ValueError(f"Calendar {calendar!r} lists no holidays and no coverage")
+    first, last = pd.Timestamp(holidays[0]), pd.Timestamp(holidays[-1])
+    return pd.Timestamp(first.year, 1, 1), pd.Timestamp(last.year, 12, 31)
+
+
+def check_coverage(calendar, start, end):
+    """
+    Raise ValueError if start..end reaches outside the calendar's
+    coverage, where its holidays are unknown.
+    """
+    coverage = calendar_coverage(calendar)
+    if coverage is None:
+        return
+    first, last = coverage
+    if pd.Timestamp(start) < first or pd.Timestamp(end) > last:
+        raise ValueError(
+            f"Calendar {calendar!r} covers {first.date()} to {last.date()}, "
+            f"the timeline runs {pd.Timestamp(start).date()} to {pd.Timestamp(end).date()}: "
+            f"extend {calendar_path(calendar)}"
+        )
+
+
+def _cache_file(calendar, end, periods, holidays):
+    digest = hashlib.sha256(holidays.astype(np.int64).tobytes()).hexdigest()[:12]
+    return os.path.join(CACHE_DIR, f"{calendar}_{end.date()}_{periods}_{digest}.npy")
+
+
+def demo_business_days(end, periods, calendar=None, use_cache=True):
+    """
+    The last `periods` business days ending on or before `end`.
+
+    calendar=None skips weekends only (pd.bdate_range). A named calendar
+    also skips its holidays through a CustomBusinessDay, and raises
+    ValueError if the timeline leaves the calendar's coverage; that
+    timeline is cached on disk and reused by later runs with the same key.
+    """
+    end = pd.Timestamp(end)
+
+    if calendar is None:
+        return pd.bdate_range(end=end, periods=periods).as_unit("ns")
+
+    holidays = load_holidays(calendar)
+    cache = _cache_file(calendar, end, periods, holidays)
+
+    if use_cache and os.path.exists(cache):
+        days = pd.DatetimeIndex(np.load(cache)).as_unit("ns")
+        check_coverage(calendar, days[0], days[-1])
+        return days
+
+    days = pd.date_range(
+        end=end, periods=periods,
+        freq=CustomBusinessDay(holidays=holidays.astype("datetime64[ns]"))
+    ).as_unit("ns")
+    check_coverage(calendar, days[0], days[-1])
+
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = cache + ".tmp.npy"
+        np.save(tmp, days.to_numpy(dtype="datetime64[ns]"))
+        os.replace(tmp, cache)
+
+    return days
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from demo_calendar import available_calendars
+from demo_io import file_format, iter_demo
+from demo_rebase import DEFAULT_CHUNK_SIZE, build_date_map, read_unique_dates, unique_dates
+from demo_verify import date_map_digest, demo_dates_digest
+
+
+# =========================================================
+# CANONICAL DATE MAP
+#
+# One real→demo date map for every dataset of a demo, built once from
+# the union of the real dates of all inputs and saved as a json
+# artifact: Real_Index, real date and demo date of every day, plus
+#   - digest:       date_map_digest of the (real, demo) pairs
+#   - demo_digest:  demo_dates_digest of the demo dates
+# The rebase scripts apply it instead of building their own map (no
+# pass over the input for its dates), so every export is on the same
+# calendar by construction; the validator compares each dataset's
+# demo-date digest with demo_digest instead of comparing the dates.
+#
+#   python demo_datemap.py COMBINED.csv.gz WEIGHTS.csv.gz \
+#       --real-end 2025-10-27 --demo-end 2025-11-17 -o DEMO_DATE_MAP.json
+# =========================================================
+
+DATE_MAP_VERSION = 1
+
+
+def _source_dates(path, date_col, chunksize):
+    if file_format(path) in ("csv", "csv.gz"):
+        return read_unique_dates(path, date_col, chunksize)
+    seen = set()
+    for chunk in iter_demo(path, chunksize, columns=[date_col]):
+        seen.update(chunk[date_col].dropna().unique())
+    return unique_dates(list(seen))
+
+
+def canonical_date_map(paths, real_end, demo_end, calendar=None, date_col="Date",
+                       chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    build_date_map over the union of the real dates of every file in
+    paths, with a Real_Index column (0 = first real date).
+    """
+    real = unique_dates(np.concatenate([
+        _source_dates(path, date_col, chunksize).to_numpy() for path in paths
+    ]))
+    date_map = build_date_map(real, real_end, demo_end, calendar)
+    date_map.insert(0, "Real_Index", np.arange(len(date_map)))
+    return date_map
+
+
+def write_date_map(path, date_map, real_end, demo_end, calendar=None, sources=()):
+    """
+    Save a canonical date map (Real_Index, Date, date_demo) as json.
+    Returns its digest.
+    """
+    digest = date_map_digest(date_map["Date"], date_map["date_demo"])
+    artifact = {
+        "version": DATE_MAP_VERSION,
+        "real_end": str(pd.Timestamp(real_end).date()),
+        "demo_end": str(pd.Timestamp(demo_end).date()),
+        "calendar": calendar,
+        "sources": [str(s) for s in sources],
+        "digest": digest,
+        "demo_digest": demo_dates_digest(date_map["date_demo"]),
+        "real": [str(d.date()) for d in date_map["Date"]],
+        "demo": [str(d.date()) for d in date_map["date_demo"]],
+    }
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(artifact, fh, indent=1)
+    os.replace(tmp, path)
+    print(f"Canonical date map exported → {path} ({len(date_map):,} dates)")
+    return digest
+
+
+def read_date_map(path):
+    """
+    (date_map, artifact) of a saved canonical date map; raises ValueError
+    if its dates no longer match its digest.
+    """
+    with open(path) as fh:
+        artifact = json.load(fh)
+    if artifact.get("version") != DATE_MAP_VERSION:
+        raise ValueError(f"{path}: unsupported date map version {artifact.get('version')!r}")
+
+    real = pd.to_datetime(pd.Series(artifact["real"])).to_numpy(dtype="datetime64[ns]")
+    demo = pd.to_datetime(pd.Series(artifact["demo"])).to_numpy(dtype="datetime64[ns]")
+    date_map = pd.DataFrame({
+        "Real_Index": np.arange(len(real)),
+        "Date": real,
+        "date_demo": demo,
+    })
+    if date_map_digest(real, demo) != artifact["digest"]:
+        raise ValueError(f"{path}: dates do not match the recorded digest")
+    return date_map, artifact
+
+
+def load_date_map(path, real_end, demo_end, calendar=None):
+    """
+    The canonical date map at path, checked against the run's settings:
+    a map built for another REAL_END / DEMO_END / calendar raises
+    ValueError instead of silently rebasing onto the wrong timeline.
+    """
+    date_map, artifact = read_date_map(path)
+    expected = {
+        "real_end": str(pd.Timestamp(real_end).date()),
+        "demo_end": str(pd.Timestamp(demo_end).date()),
+        "calendar": calendar,
+    }
+    wrong = {k: artifact[k] for k, v in expected.items() if artifact[k] != v}
+    if wrong:
+        raise ValueError(f"{path} was built with {wrong}, this run uses "
+                         f"{ {k: expected[k] for k in wrong} }")
+    print(f"Canonical date map loaded ← {path} ({len(date_map):,} dates, {artifact['digest'][:12]})")
+    return date_map
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build the canonical real→demo date map of a set of inputs."
+    )
+    parser.add_argument("inputs", nargs="+", help="long-format files (csv / csv.gz / parquet / feather)")
+    parser.add_argument("--real-end", required=True, help="last real date to keep")
+    parser.add_argument("--demo-end", required=True, help="demo timeline end date")
+    parser.add_argument("--calendar", choices=available_calendars(),
+                        help="holiday calendar of the demo timeline (default: weekends only)")
+    parser.add_argument("-o", "--output", required=True, help="date map json")
+    parser.add_argument("--date-col", default="Date")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    date_map = canonical_date_map(args.inputs, args.real_end, args.demo_end, args.calendar,
+                                  args.date_col, args.chunk_size)
+    write_date_map(args.output, date_map, args.real_end, args.demo_end, args.calendar, args.inputs)
+    return date_map
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from demo_io import check_chunked, chunk_writer, iter_demo, parse_dates, schema_dtypes
+from demo_rebase import (DEFAULT_CHUNK_SIZE, apply_date_map, build_date_map,
+                         read_unique_dates, stream_rebase, write_rebased)
+from demo_trace import traced
+from demo_verify import ExportVerifier
+
+
+# =========================================================
+# INCREMENTAL REBASE
+#
+# A manifest (json) records what the previous run exported: the
+# export path, REAL_END / DEMO_END / calendar, and one entry per real
+# date with its demo date, row count, the hash of its input rows and
+# the hash of its exported rows.
+#
+# The next run reads the input once and compares the per-date input
+# hashes with the manifest. Only new or changed dates are rebased.
+# Rows of unchanged dates are carried over from the previous export:
+#   - "append":  their demo dates did not move (DEMO_END advanced with
+#                REAL_END) and the export is csv(.gz) — the previous
+#                file is copied and the new rows appended as new gzip
+#                members, nothing old is re-encoded
+#   - "rewrite": demo dates moved, dates changed or disappeared, or
+#                the export is parquet — the previous export is re-read
+#                chunk by chunk with its Date column shifted
+#   - "full":    no usable manifest — two-pass streaming rebase
+# =========================================================
+
+MANIFEST_VERSION = 1
+
+
+class InputDigest:
+    """
+    Per real date: rows and the order-independent sum of the row hashes
+    of the input rows, exactly as read (date column as text).
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.hashes = {}
+
+    def update(self, chunk, real_dates):
+        keys = np.asarray(real_dates, dtype="datetime64[ns]").view("i8")
+        codes, uniques = pd.factorize(keys)
+
+        row_hash = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        rows = np.bincount(codes, minlength=len(uniques))
+        sums = np.zeros(len(uniques), dtype=np.uint64)
+        np.add.at(sums, codes, row_hash)
+
+        for key, n, h in zip(uniques.tolist(), rows.tolist(), sums.tolist()):
+            self.rows[key] = self.rows.get(key, 0) + n
+            self.hashes[key] = (self.hashes.get(key, 0) + h) % 2**64
+
+    def table(self):
+        keys = np.array(sorted(self.rows), dtype=np.int64)
+        return pd.DataFrame({
+            "Date": keys.view("datetime64[ns]"),
+            "Rows": np.array([self.rows[k] for k in keys.tolist()], dtype=np.int64),
+            "InputHash": np.array([self.hashes[k] for k in keys.tolist()], dtype=np.uint64),
+        })
+
+
+# -------------------------------------
+# Manifest
+# -------------------------------------
+def load_manifest(path):
+    """
+    The previous run's manifest, or None if there is no usable one.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if not os.path.exists(manifest["export"]):
+        return None
+    return manifest
+
+
+def manifest_dates(manifest):
+    """
+    Per-date table of a manifest: Date (real), date_demo, Rows,
+    InputHash and RowHash (uint64).
+    """
+    dates = pd.DataFrame(manifest["dates"])
+    return pd.DataFrame({
+        "Date": pd.to_datetime(dates["real"]).to_numpy(dtype="datetime64[ns]"),
+        "date_demo": pd.to_datetime(dates["demo"]).to_numpy(dtype="datetime64[ns]"),
+        "Rows": dates["rows"].to_numpy(dtype=np.int64),
+        "InputHash": np.array([int(h, 16) for h in dates["input_hash"]], dtype=np.uint64),
+        "RowHash": np.array([int(h, 16) for h in dates["row_hash"]], dtype=np.uint64),
+    })
+
+
+def write_manifest(path, input_path, export_path, real_end, demo_end, calendar,
+                   inputs, verifier):
+    """
+    Record this run: inputs is InputDigest.table(), verifier the
+    ExportVerifier of the finished export.
+    """
+    per_date = verifier.per_date().merge(
+        inputs.rename(columns={"Date": "Date_real", "Rows": "InputRows"}),
+        on="Date_real", how="left"
+    )
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "input": str(input_path),
+        "export": str(export_path),
+        "real_end": str(pd.Timestamp(real_end).date()),
+        "demo_end": str(pd.Timestamp(demo_end).date()),
+        "calendar": calendar,
+        "columns": verifier.columns,
+        "dates": [
+            {
+                "real": str(real.date()),
+                "demo": str(demo.date()),
+                "rows": int(rows),
+                "input_hash": f"{int(input_hash):016x}",
+                "row_hash": f"{int(row_hash):016x}",
+            }
+            for real, demo, rows, input_hash, row_hash in zip(
+                per_date["Date_real"], per_date["Date_demo"], per_date["Rows"],
+                per_date["InputHash"], per_date["RowHash"]
+            )
+        ],
+    }
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+
+
+# -------------------------------------
+# Input passes
+# -------------------------------------
+def _read_chunks(path, real_end, date_col, chunksize, schema=None):
+    """
+    Input chunks as stream_rebase reads them, restricted to real dates
+    <= real_end, with their parsed real dates.
+    """
+    real_end = pd.Timestamp(real_end)
+    dtype = {**schema_dtypes(schema), date_col: str}
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+        real = parse_dates(chunk[date_col])
+        keep = np.flatnonzero((real <= real_end).to_numpy())
+        yield chunk.take(keep), real.take(keep)
+
+
+def scan_input(path, known_dates, real_end, date_col="Date", chunksize=DEFAULT_CHUNK_SIZE,
+               schema=None):
+    """
+    One pass over the input: an InputDigest of every real date <=
+    real_end, plus the rows of the dates not in known_dates.
+    """
+    digest = InputDigest()
+    fresh = []
+    for chunk, real in _read_chunks(path, real_end, date_col, chunksize, schema):
+        digest.update(chunk, real)
+        new = ~real.isin(known_dates).to_numpy()
+        if new.any():
+            fresh.append(chunk.take(np.flatnonzero(new)))
+    return digest, fresh
+
+
+def collect_dates(path, dates, real_end, date_col="Date", chunksize=DEFAULT_CHUNK_SIZE,
+                  schema=None):
+    """
+    The input rows of the given real dates (changed dates only, so small).
+    """
+    parts = []
+    for chunk, real in _read_chunks(path, real_end, date_col, chunksize, schema):
+        hit = real.isin(dates).to_numpy()
+        if hit.any():
+            parts.append(chunk.take(np.flatnonzero(hit)))
+    return parts
+
+
+# -------------------------------------
+# Previous export
+# -------------------------------------
+def carry_previous(prev_path, write, shift_map, date_map, date_col="Date",
+                   verifier=None, chunksize=DEFAULT_CHUNK_SIZE, schema=None):
+    """
+    Re-read the previous export and write the rows of the dates in
+    shift_map (Date = old demo date, date_demo = new demo date) with
+    their date moved. Returns the rows written.
+    """
+    rows = 0
+    for chunk in iter_demo(prev_path, chunksize, schema=schema):
+        date_demo = apply_date_map(chunk[date_col], shift_map)
+        keep = ~np.isnat(date_demo)
+        chunk = chunk.take(np.flatnonzero(keep))
+        chunk[date_col] = date_demo[keep]
+
+        if verifier is not None:
+            real_dates = apply_date_map(chunk[date_col], date_map, src="date_demo", dst="Date")
+            verifier.update(chunk, real_dates)
+        write(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def _staging_path(path):
+    # Next to path (same file system for os.replace), same extension
+    head, tail = os.path.split(str(path))
+    return os.path.join(head, f".{os.getpid()}.{tail}")
+
+
+def _same_csv_kind(a, b):
+    a, b = str(a).lower(), str(b).lower()
+    return a.endswith(".csv.gz") and b.endswith(".csv.gz") or \
+        a.endswith(".csv") and b.endswith(".csv")
+
+
+# =========================================================
+# DRIVER
+# =========================================================
+@traced(rows=lambda result: result[2]["rows_rebased"])
+def incremental_rebase(path, out_path, manifest_path, real_end, demo_end,
+                       calendar=None, date_col="Date", chunksize=DEFAULT_CHUNK_SIZE,
+                       on_chunk=None, workers=1, date_map=None, schema=None):
+    """
+    Rebase path into out_path, reusing the export recorded in
+    manifest_path for every real date whose input rows did not change,
+    and update the manifest once the export verifies. out_path may be
+    the previous export: it is only replaced (or appended to) for good
+    once the new export verifies.
+
+    on_chunk(chunk, date_demo) sees only the rows rebased in this run.
+    date_map (e.g. the canonical one of demo_datemap) replaces the map
+    built from the input's own dates. schema (a SCHEMAS name) types the
+    chunks as in stream_rebase.
+
+    Returns (date_map, verifier, stats); stats["mode"] is "full",
+    "append" or "rewrite".
+    """
+    check_chunked(out_path)
+    manifest = load_manifest(manifest_path)
+    if manifest is not None and manifest["columns"] != list(pd.read_csv(path, nrows=0).columns):
+        manifest = None
+
+    # ---------- No previous run: full two-pass rebase, hashing the input ----------
+    if manifest is None:
+        digest = InputDigest()
+
+        def hash_and_collect(chunk, date_demo):
+            digest.update(chunk, parse_dates(chunk[date_col]))
+            if on_chunk is not None:
+                on_chunk(chunk, date_demo)
+
+        if date_map is None:
+            real_dates = read_unique_dates(path, date_col, chunksize)
+            date_map = build_date_map(real_dates, real_end, demo_end, calendar)
+        verifier = ExportVerifier(date_map, date_col)
+        _, rows_out = stream_rebase(path, out_path, date_map, date_col, chunksize,
+                                    hash_and_collect, verifier, workers, schema)
+
+        stats = {"mode": "full", "new_dates": len(date_map), "changed_dates": 0,
+                 "removed_dates": 0, "rows_carried": 0, "rows_rebased": rows_out}
+
+    # ---------- Previous run: compare per-date hashes ----------
+    else:
+        previous = manifest_dates(manifest)
+        digest, fresh = scan_input(path, previous["Date"], real_end, date_col, chunksize, schema)
+        inputs = digest.table()
+
+        if date_map is None:
+            date_map = build_date_map(inputs["Date"], real_end, demo_end, calendar)
+        verifier = ExportVerifier(date_map, date_col)
+
+        both = previous.merge(inputs, on="Date", how="inner", suffixes=("_prev", ""))
+        same = (both["Rows_prev"] == both["Rows"]) & (both["InputHash_prev"] == both["InputHash"])
+        unchanged = both.loc[same, ["Date", "date_demo", "Rows", "RowHash"]]
+        changed = both.loc[~same, "Date"]
+        removed = previous.loc[~previous["Date"].isin(inputs["Date"]), "Date"]
+
+        # old demo date → new demo date, for the dates carried over
+        new_demo = apply_date_map(unchanged["Date"], date_map)
+        shift_map = pd.DataFrame({
+            "Date": unchanged["date_demo"].to_numpy(dtype="datetime64[ns]"),
+            "date_demo": new_demo,
+        })
+
+        fresh += collect_dates(path, changed, real_end, date_col, chunksize, schema) \
+            if len(changed) else []
+
+        prev_export = manifest["export"]
+        in_place = (
+            (shift_map["Date"].to_numpy() == new_demo).all() and
+            not len(changed) and not len(removed) and
+            _same_csv_kind(prev_export, out_path)
+        )
+
+        # The export may be the previous one itself (a fixed output path):
+        # nothing of it is lost until the new rows verify
+        same_file = os.path.abspath(prev_export) == os.path.abspath(out_path)
+
+        if in_place:
+            # Old rows are copied byte for byte; new rows become new gzip members
+            if same_file:
+                prev_size = os.path.getsize(out_path)
+            else:
+                shutil.copyfile(prev_export, out_path)
+            verifier.carry(
+                pd.DataFrame({
+                    "Date_real": unchanged["Date"].to_numpy(dtype="datetime64[ns]"),
+                    "Date_demo": new_demo,
+                    "Rows": unchanged["Rows"].to_numpy(),
+                    "RowHash": unchanged["RowHash"].to_numpy(),
+                }),
+                manifest["columns"],
+            )
+            # (serially if there is nothing new: that still closes the file
+            # with an empty gzip member, which the trailer check expects)
+            try:
+                with chunk_writer(out_path, verifier, workers if fresh else 1, append=True) as write:
+                    _, rows_out = write_rebased(fresh, write, date_map, date_col, on_chunk, verifier)
+            except BaseException:
+                if same_file:
+                    os.truncate(out_path, prev_size)
+                raise
+            if same_file and not verifier.ok():
+                # Drop the appended rows, or every re-run would add them again
+                os.truncate(out_path, prev_size)
+            rows_carried = verifier.carried_rows
+        else:
+            target = _staging_path(out_path) if same_file else out_path
+            try:
+                with chunk_writer(target, verifier, workers, schema=schema) as write:
+                    rows_carried = carry_previous(prev_export, write, shift_map, date_map,
+                                                  date_col, verifier, chunksize, schema)
+                    _, rows_out = write_rebased(fresh, write, date_map, date_col, on_chunk, verifier)
+            except BaseException:
+                if same_file and os.path.exists(target):
+                    os.remove(target)
+                raise
+            if same_file:
+                if verifier.ok():
+                    os.replace(target, out_path)
+                else:
+                    os.remove(target)
+
+        stats = {"mode": "append" if in_place else "rewrite",
+                 "new_dates": int((~inputs["Date"].isin(previous["Date"])).sum()),
+                 "changed_dates": len(changed), "removed_dates": len(removed),
+                 "rows_carried": rows_carried, "rows_rebased": rows_out}
+
+    if verifier.ok():
+        write_manifest(manifest_path, path, out_path, real_end, demo_end, calendar,
+                       digest.table(), verifier)
+    elif manifest is not None and os.path.abspath(manifest["export"]) == os.path.abspath(out_path):
+        print(f"Export did not verify; {out_path} and manifest {manifest_path} left as before")
+    else:
+        print(f"Export did not verify; manifest {manifest_path} left unchanged")
+
+    return date_map, verifier, stats
@@ -0,0 +1,409 @@
+import gzip
+import re
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from demo_trace import traced
+
+
+# =========================================================
+# SHARED LOADERS FOR LONG-FORMAT DEMO FILES
+# =========================================================
+
+
+# =========================================================
+# DATE PARSING
+# =========================================================
+def parse_dates(values):
+    """
+    Parse a date column through its integer codes.
+
+    The long files carry a few hundred distinct dates across millions of
+    rows, so the column is factorized, only the distinct strings are
+    parsed, and the result is broadcast back through the codes. Cost is
+    O(unique dates) for parsing plus one O(rows) integer take.
+    """
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+
+    parsed = pd.to_datetime(pd.Series(uniques)).to_numpy(dtype="datetime64[ns]")
+    out = parsed.take(codes) if len(parsed) else np.empty(len(codes), dtype="datetime64[ns]")
+    out[codes < 0] = np.datetime64("NaT")
+
+    return pd.Series(out, index=values.index, name=values.name)
+
+
+# =========================================================
+# DATASET SCHEMAS
+# =========================================================
+# Declared dtypes per dataset: identifiers and metric levels as
+# categories, values as float64 where they are written back to a demo
+# export and float32 where they are only plotted. Columns a file does
+# not have are ignored; undeclared columns keep read_csv's inference.
+# Date is always parsed separately (parse_dates).
+SCHEMAS = {
+    "Combined_Long": {
+        "BarraId": "category", "SECURITY_NAME": "category",
+        "Metric": "category", "Metric_Level1": "category", "Metric_Level2": "category",
+        "Value": "float64",
+    },
+    "Weights_Long": {
+        "BarraId": "category", "SECURITY_NAME": "category",
+    },
+    "Proximity": {
+        "BarraId": "category", "ContextualVarGroup": "category",
+        "value": "float32",
+    },
+}
+
+# Columns each task needs (usecols)
+TASK_COLUMNS = {
+    "confirmation": ["BarraId", "SECURITY_NAME", "Date",
+                     "Metric", "Metric_Level1", "Metric_Level2", "Value"],
+    "validation": ["Date"],
+    "trellis": ["BarraId", "Date", "ContextualVarGroup", "value"],
+}
+
+
+def schema_dtypes(schema, columns=None):
+    """
+    {column: dtype} of a SCHEMAS entry, restricted to columns if given.
+    """
+    dtypes = SCHEMAS[schema] if schema is not None else {}
+    return {c: t for c, t in dtypes.items() if columns is None or c in columns}
+
+
+# =========================================================
+# SECURITY SELECTION BY NAME
+#
+# Name matching runs on the distinct SECURITY_NAME values only; rows
+# are then selected by an integer isin on their BarraId codes.
+# =========================================================
+def name_index(df, name_col="SECURITY_NAME", id_col="BarraId"):
+    """
+    Distinct (name, BarraId) pairs of df, computed on factorized codes.
+    """
+    name_codes, names = pd.factorize(df[name_col])
+    id_codes, ids = pd.factorize(df[id_col])
+
+    ok = (name_codes >= 0) & (id_codes >= 0)
+    m = len(ids)
+    keys = pd.unique(name_codes[ok].astype(np.int64) * m + id_codes[ok])
+
+    return pd.DataFrame({
+        name_col: np.asarray(names)[keys // m] if m else [],
+        id_col: np.asarray(ids)[keys % m] if m else [],
+    })
+
+
+def target_ids(index, targets, name_col="SECURITY_NAME", id_col="BarraId"):
+    """
+    BarraIds whose name contains any of targets (case-insensitive).
+    Raises ValueError on no targets or a blank one, which would match
+    every security.
+    """
+    targets = list(targets)
+    if not targets or not all(str(t).strip() for t in targets):
+        raise ValueError(f"target names must be non-empty, got {targets!r}")
+    pattern = "|".join(re.escape(t.upper()) for t in targets)
+    hit = index[name_col].astype(str).str.upper().str.contains(pattern, regex=True).to_numpy()
+    return pd.unique(index[id_col].to_numpy()[hit])
+
+
+def target_mask(df, ids, id_col="BarraId"):
+    """
+    Boolean row mask of df[id_col] in ids, as an integer isin on codes.
+    """
+    col = df[id_col]
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes, uniques = col.cat.codes.to_numpy(), col.cat.categories
+    else:
+        codes, uniques = pd.factorize(col)
+    wanted = pd.Index(uniques).get_indexer(pd.Index(ids))
+    return np.isin(codes, wanted[wanted >= 0])
+
+
+# =========================================================
+# LOADERS
+# =========================================================
+@traced(rows=len)
+def read_long(path, date_col="Date", schema=None, **read_csv_kwargs):
+    """
+    pd.read_csv with date_col read as plain strings and parsed once via
+    parse_dates. schema (a SCHEMAS name) sets the declared dtypes; extra
+    keyword arguments (usecols, ...) go straight to read_csv.
+    """
+    dtype = schema_dtypes(schema, read_csv_kwargs.get("usecols"))
+    dtype.update(read_csv_kwargs.pop("dtype", None) or {})
+    dtype[date_col] = str
+
+    df = pd.read_csv(path, dtype=dtype, **read_csv_kwargs)
+    df[date_col] = parse_dates(df[date_col])
+    return df
+
+
+# =========================================================
+# DEMO EXPORT FORMATS (csv.gz / parquet / feather)
+# =========================================================
+# Identifier and metric-level columns are written dictionary-encoded
+# and come back as pandas categoricals.
+DICT_COLUMNS = (
+    "BarraId", "SECURITY_NAME",
+    "Metric", "Metric_Level1", "Metric_Level2",
+    "ContextualVarGroup",
+)
+
+EXPORT_FORMATS = ("csv.gz", "parquet", "feather")
+# Those chunk_writer streams to (feather is whole-table only)
+CHUNKED_FORMATS = ("csv.gz", "parquet")
+
+
+def file_format(path):
+    """
+    "parquet", "feather", "excel" or "csv", from the file extension.
+    """
+    path = str(path).lower()
+    if path.endswith(".parquet"):
+        return "parquet"
+    if path.endswith((".feather", ".arrow")):
+        return "feather"
+    if path.endswith((".xlsx", ".xls")):
+        return "excel"
+    return "csv"
+
+
+def _arrow_schema(table, schema=None):
+    """
+    Schema of table with every DICT_COLUMNS string column turned into
+    dictionary<int32, string>, so all chunks of a file share one schema.
+    Columns declared in schema (a SCHEMAS name) take their declared
+    type instead of the one inferred from this table, which may be a
+    chunk whose column happens to be all null.
+    """
+    import pyarrow as pa
+
+    declared = schema_dtypes(schema)
+    fields = []
+    for field in table.schema:
+        dtype = declared.get(field.name)
+        if field.name in DICT_COLUMNS or dtype == "category":
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        elif dtype is not None:
+            field = field.with_type(pa.from_numpy_dtype(np.dtype(dtype)))
+        fields.append(field)
+    return pa.schema(fields, metadata=table.schema.metadata)
+
+
+def _to_arrow(df, schema=None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = schema or _arrow_schema(table)
+    # An all-null column is read as float64 whatever it holds elsewhere
+    for i, field in enumerate(schema):
+        column = table.column(i)
+        if column.type != field.type and column.null_count == len(column):
+            table = table.set_column(i, field, pa.nulls(len(column), field.type))
+    return table.cast(schema)
+
+
+# csv chunks are rendered (and, in parallel mode, compressed) this many
+# rows at a time
+CSV_BLOCK_ROWS = 200_000
+GZIP_LEVEL = 9
+
+
+def _csv_blocks(chunk, header):
+    """
+    Encoded csv text of chunk, CSV_BLOCK_ROWS rows at a time.
+    """
+    for start in range(0, max(len(chunk), 1), CSV_BLOCK_ROWS):
+        block = chunk.iloc[start:start + CSV_BLOCK_ROWS]
+        yield block.to_csv(index=False, header=header and start == 0).encode("utf-8")
+
+
+@contextmanager
+def _parallel_gzip(path, verifier, workers, mode="wb"):
+    """
+    Compress each csv block as its own gzip member in a thread pool (zlib
+    releases the GIL) and append the members in order. Concatenated
+    members are one valid gzip stream for gzip / pandas / zcat.
+    """
+    with open(path, mode) as fh, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def emit(data):
+            if verifier is not None:
+                verifier.update_bytes(data, new_member=True)
+            pending.append(pool.submit(gzip.compress, data, GZIP_LEVEL))
+            while len(pending) > 2 * workers:
+                fh.write(pending.popleft().result())
+
+        yield emit
+
+        while pending:
+            fh.write(pending.popleft().result())
+
+
+@contextmanager
+def _serial_csv(path, verifier, mode="wb"):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, mode) as fh:
+
+        def emit(data):
+            fh.write(data)
+            if verifier is not None:
+                verifier.update_bytes(data)
+
+        yield emit
+
+
+def check_chunked(path):
+    """
+    Raise ValueError unless chunk_writer can write path; called before
+    a streaming run reads any input.
+    """
+    fmt = file_format(path)
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Chunked export supports csv(.gz) and parquet, not {fmt}: {path}")
+
+
+@contextmanager
+def chunk_writer(path, verifier=None, workers=1, append=False, schema=None):
+    """
+    Context manager yielding write(chunk): append DataFrame chunks to a
+    csv (.gz) or parquet file without holding the whole table. Feather
+    files allow one dictionary per column, so they are whole-table only.
+    The parquet schema is the first chunk's, with the declared types of
+    schema (a SCHEMAS name) for its columns.
+
+    workers > 1 compresses csv.gz output in parallel as a multi-member
+    gzip. For csv, verifier.update_bytes() sees the exact bytes written.
+    append=True adds rows (no header) to an existing csv (.gz) file; a
+    .gz file gets them as new gzip members.
+    """
+    fmt = file_format(path)
+
+    if fmt == "csv":
+        mode = "ab" if append else "wb"
+        if workers > 1 and str(path).endswith(".gz"):
+            sink = _parallel_gzip(path, verifier, workers, mode)
+        else:
+            sink = _serial_csv(path, verifier, mode)
+
+        with sink as emit:
+            header = not append
+
+            def write(chunk):
+                nonlocal header
+                for data in _csv_blocks(chunk, header):
+                    emit(data)
+                header = False
+
+            yield write
+        return
+
+    check_chunked(path)
+    if append:
+        raise ValueError(f"Appending is supported for csv(.gz) only: {path}")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, arrow_schema = None, None
+
+    def write(chunk):
+        nonlocal writer, arrow_schema
+        if writer is None:
+            arrow_schema = _arrow_schema(pa.Table.from_pandas(chunk, preserve_index=False), schema)
+            writer = pq.ParquetWriter(path, arrow_schema, compression="zstd")
+        writer.write_table(_to_arrow(chunk, arrow_schema))
+
+    try:
+        yield write
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+@traced()
+def write_demo(df, path, verifier=None, workers=1):
+    """
+    Write a demo export; the format follows the extension of path.
+    workers > 1 compresses csv.gz in parallel.
+    """
+    if file_format(path) == "feather":
+        import pyarrow.feather as feather
+
+        feather.write_feather(_to_arrow(df), path, compression="lz4")
+        return
+
+    with chunk_writer(path, verifier, workers) as write:
+        write(df)
+
+
+@traced(rows=len)
+def read_demo(path, columns=None, date_col="Date", schema=None):
+    """
+    Read a demo export (csv / csv.gz / parquet / feather / xlsx), loading
+    only `columns` if given. date_col is always returned as datetime64;
+    schema (a SCHEMAS name) applies its declared dtypes.
+    """
+    fmt = file_format(path)
+
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    elif fmt == "feather":
+        df = pd.read_feather(path, columns=columns)
+    elif fmt == "excel":
+        df = pd.read_excel(path, usecols=columns)
+    else:
+        return read_long(path, date_col=date_col, schema=schema, usecols=columns)
+
+    dtypes = schema_dtypes(schema, df.columns)
+    if dtypes:
+        df = df.astype(dtypes)
+
+    # Dictionary order is first-appearance order; sort the categories so
+    # sort_values on them matches plain string sorting.
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+
+    if date_col in df.columns:
+        df[date_col] = parse_dates(df[date_col])
+    return df
+
+
+def iter_demo(path, chunksize, columns=None, schema=None):
+    """
+    Iterate over a demo export in DataFrame chunks of about chunksize
+    rows (record batches for the columnar formats). schema applies its
+    declared dtypes to the csv chunks.
+    """
+    fmt = file_format(path)
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == "feather":
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield batch.to_pandas()
+    elif fmt == "excel":
+        # openpyxl cannot stream a sheet through pandas: one chunk
+        yield pd.read_excel(path, usecols=columns)
+    else:
+        dtype = schema_dtypes(schema, columns)
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype or None, chunksize=chunksize)
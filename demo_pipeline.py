@@ -0,0 +1,358 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+import pandas as pd
+
+from demo_cache import file_digest
+from demo_calendar import load_holidays
+from demo_datemap import canonical_date_map, load_date_map, read_date_map, write_date_map
+from demo_incremental import incremental_rebase
+from demo_rebase import stream_rebase
+from demo_trace import active_log, collect_stages, start_run
+from demo_verify import ExportVerifier
+
+
+# =========================================================
+# END-TO-END DEMO PIPELINE
+#
+# One entry point for the whole demo rebuild, driven by one config:
+#
+#   date_map ─┬─→ rebase_alphas  ─┐
+#             └─→ rebase_weights ─┼─→ validate (ex-post checks + dashboard)
+#                 proximity_scan ─┘
+#
+# date_map builds the canonical real→demo map from the union of the
+# real dates of both inputs (demo_datemap) and both rebases apply it,
+# so their calendars agree by construction. The rebases and the
+# Proximity scan run at the same time in worker processes; validate
+# runs in this process on their results
+# (the per-date row counts of each export, as counted while it was
+# written, so no export is read again). A stage whose inputs, settings
+# and upstream stages are unchanged since the last run — and whose
+# outputs still exist — is skipped and its recorded result reused
+# (pipeline_state.json in output_dir).
+#
+#   python demo_pipeline.py                  # CONFIG below
+#   python demo_pipeline.py pipeline.json    # same keys, as json
+# =========================================================
+
+CONFIG = {
+    "real_end": "2025-10-27",       # last real date to keep
+    "demo_end": "2025-11-17",       # demo timeline end date
+    "calendar": None,               # None (weekends only) or a name under calendars/
+    "inputs": {
+        "combined": "/Users/billyeskel/var/inputs/pwbi_dyn/Global_LC_Combined_Long_20251109_2113_sub.csv.gz",
+        "weights": "/Users/billyeskel/var/inputs/pwbi_dyn/Global_LC_Weights_Long_20251110_2139_weights_long.csv.gz",
+        "proximity": "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Proximity Data.xlsx",
+    },
+    "output_dir": "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/pipeline/",
+    "format": "csv.gz",             # demo export format: "csv.gz" or "parquet"
+    "incremental": False,           # rebase only new / changed dates (demo_incremental)
+    "chunk_size": 1_000_000,
+    "gzip_workers": 1,
+    "workers": 3,                   # stage processes
+    "profile": None,                # run-log profile dumps (demo_trace)
+}
+
+# Bump when a stage changes what it writes, to re-run every stage once
+PIPELINE_VERSION = 3
+
+STATE_FILE = "pipeline_state.json"
+
+
+# =========================================================
+# STAGES
+#
+# stage(config, upstream) → json-able result with the stage's
+# "outputs" (paths); upstream maps each dependency to its result.
+# =========================================================
+def _date_map_path(config):
+    demo_end = pd.Timestamp(config["demo_end"]).date()
+    return os.path.join(config["output_dir"], f"DEMO_DATE_MAP_ending_{demo_end}.json")
+
+
+def stage_date_map(config, upstream):
+    """
+    The canonical date map of the Combined_Long and Weights_Long inputs.
+    """
+    inputs = [config["inputs"]["combined"], config["inputs"]["weights"]]
+    date_map = canonical_date_map(inputs, config["real_end"], config["demo_end"],
+                                  config["calendar"], chunksize=config["chunk_size"])
+    path = _date_map_path(config)
+    write_date_map(path, date_map, config["real_end"], config["demo_end"], config["calendar"], inputs)
+    _, artifact = read_date_map(path)
+    return {"outputs": [path], "path": path, "digest": artifact["digest"],
+            "demo_digest": artifact["demo_digest"], "total_rows": len(date_map)}
+
+
+def _export_path(config, name):
+    demo_end = pd.Timestamp(config["demo_end"]).date()
+    return os.path.join(config["output_dir"], f"{name}_DEMO_ending_{demo_end}.{config['format']}")
+
+
+def _rebase(config, upstream, key, name, schema):
+    """
+    Streaming rebase of one long-format input onto the canonical date
+    map (no pass over the input for its dates), read with the declared
+    dtypes of schema (a SCHEMAS name). The result carries the
+    per-date row counts of the export (from its ExportVerifier), for
+    the dates that have rows.
+    """
+    path = config["inputs"][key]
+    out_path = _export_path(config, name)
+    date_map = load_date_map(upstream["date_map"]["path"], config["real_end"],
+                             config["demo_end"], config["calendar"])
+
+    if config["incremental"]:
+        manifest = os.path.join(config["output_dir"], f"{name}_DEMO_manifest.json")
+        _, verifier, _ = incremental_rebase(
+            path, out_path, manifest, config["real_end"], config["demo_end"], config["calendar"],
+            chunksize=config["chunk_size"], workers=config["gzip_workers"], date_map=date_map,
+            schema=schema
+        )
+        outputs = [out_path, manifest]
+    else:
+        verifier = ExportVerifier(date_map)
+        stream_rebase(path, out_path, date_map, chunksize=config["chunk_size"],
+                      verifier=verifier, workers=config["gzip_workers"], schema=schema)
+        outputs = [out_path]
+
+    confirm_path = os.path.join(config["output_dir"], f"{name}_DEMO_DATE_SHIFT_CONFIRMATION.csv")
+    date_map[["Date", "date_demo"]].sort_values("Date").to_csv(confirm_path, index=False)
+
+    # Dates of the map with no exported rows are gaps of this dataset
+    per_date = verifier.per_date()
+    per_date = per_date[per_date["Rows"] > 0]
+    return {
+        "outputs": outputs + [confirm_path],
+        "export": out_path,
+        "verified": bool(verifier.ok()),
+        "map_digest": verifier.map_digest,
+        "dates": [str(d.date()) for d in per_date["Date_demo"]],
+        "rows": per_date["Rows"].tolist(),
+        "total_rows": int(per_date["Rows"].sum()),
+    }
+
+
+def stage_rebase_alphas(config, upstream):
+    return _rebase(config, upstream, "combined", "Global_LC_Combined_Long", "Combined_Long")
+
+
+def stage_rebase_weights(config, upstream):
+    return _rebase(config, upstream, "weights", "Global_LC_Weights_Long", "Weights_Long")
+
+
+def stage_proximity_scan(config, upstream):
+    """
+    Per-date row counts of the Proximity file (through its store and
+    the scan cache).
+    """
+    from ex_post_date_validations_alpha_wgts_prox import scan_distinct_dates
+
+    dates, rows = scan_distinct_dates(config["inputs"]["proximity"], config["chunk_size"])
+    return {"outputs": [], "dates": [str(pd.Timestamp(d).date()) for d in dates], "total_rows": rows}
+
+
+def stage_validate(config, upstream):
+    """
+    Ex-post business-day checks of the three datasets from the upstream
+    per-date counts, and the dashboard.
+    """
+    from ex_post_date_validations_alpha_wgts_prox import (
+        build_dashboard, build_expost_from_dates, validation_summary,
+    )
+
+    holidays = load_holidays(config["calendar"])
+    datasets = []
+    for stage, prefix in [("rebase_alphas", "Combined_Long"),
+                          ("rebase_weights", "Weights_Long"),
+                          ("proximity_scan", "Proximity")]:
+        result = upstream[stage]
+        datasets.append(build_expost_from_dates(result["dates"], prefix, result["total_rows"], holidays))
+
+    canonical = upstream["date_map"]
+    build_dashboard(datasets, config["output_dir"], canonical["demo_digest"])
+
+    rebases = [upstream[s] for s in ["rebase_alphas", "rebase_weights"]]
+    summary = validation_summary(datasets, canonical["demo_digest"])
+    checks = {
+        "weekdays_ok": summary["weekdays_ok"],
+        "sequences_ok": summary["sequences_ok"],
+        "calendars_match": summary["calendars_match"],
+        "maps_match": all(r["map_digest"] == canonical["digest"] for r in rebases),
+        "exports_verified": all(r["verified"] for r in rebases),
+    }
+    return {
+        "outputs": [os.path.join(config["output_dir"], "DEMO_SHIFT_EXPOST_DASHBOARD.xlsx")],
+        "checks": checks,
+        "ok": all(checks.values()),
+    }
+
+
+# name → (function, dependencies, runs in a worker process, config keys it depends on)
+STAGES = {
+    "date_map": (stage_date_map, [], True,
+                 ["real_end", "demo_end", "calendar", "inputs.combined", "inputs.weights"]),
+    "rebase_alphas": (stage_rebase_alphas, ["date_map"], True,
+                      ["format", "incremental", "inputs.combined"]),
+    "rebase_weights": (stage_rebase_weights, ["date_map"], True,
+                       ["format", "incremental", "inputs.weights"]),
+    "proximity_scan": (stage_proximity_scan, [], True, ["inputs.proximity"]),
+    "validate": (stage_validate, ["date_map", "rebase_alphas", "rebase_weights", "proximity_scan"],
+                 False, ["calendar"]),
+}
+
+
+# =========================================================
+# CHANGE DETECTION
+# =========================================================
+def _setting(config, key):
+    value = config
+    for part in key.split("."):
+        value = value[part]
+    return value
+
+
+def stage_fingerprint(name, config, fingerprints):
+    """
+    Hash of what a stage's result depends on: its settings, the
+    contents of its input files and its upstream stages' fingerprints.
+    """
+    _, deps, _, keys = STAGES[name]
+    settings = {}
+    for key in keys:
+        value = _setting(config, key)
+        if key.startswith("inputs."):
+            value = [os.path.abspath(value), file_digest(value)]
+        settings[key] = value
+
+    spec = json.dumps([PIPELINE_VERSION, name, config["output_dir"], settings,
+                       [fingerprints[d] for d in deps]], sort_keys=True, default=str)
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def _reusable(entry, fingerprint):
+    return (
+        entry is not None and
+        entry["fingerprint"] == fingerprint and
+        all(os.path.exists(p) for p in entry["result"]["outputs"])
+    )
+
+
+# =========================================================
+# RUNNER
+# =========================================================
+def run_stage(name, config, upstream, trace=False):
+    """
+    Run one stage (in a worker process or in place); returns
+    (result, seconds, stage records).
+    """
+    func = STAGES[name][0]
+    start = time.perf_counter()
+    with collect_stages(trace) as stages:
+        result = func(config, upstream)
+    return result, time.perf_counter() - start, stages
+
+
+def run_pipeline(config=CONFIG, force=False):
+    """
+    Run every stage whose fingerprint changed (all with force), as soon
+    as its dependencies are done. Returns {stage: result}.
+    """
+    os.makedirs(config["output_dir"], exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_log = start_run("demo_pipeline",
+                        os.path.join(config["output_dir"], f"DEMO_PIPELINE_RUNLOG_{ts}.json"),
+                        config["profile"])
+
+    state = {} if force else load_state(config["output_dir"])
+    results, fingerprints = {}, {}
+    pending = dict(STAGES)
+    running = {}
+    started = time.perf_counter()
+
+    def finish(name, result, seconds, stages, skipped=False):
+        results[name] = result
+        state[name] = {"fingerprint": fingerprints[name], "result": result}
+        save_state(config["output_dir"], state)
+        run_log.extend([{"stage": name, "depth": 0, "rows": result.get("total_rows"), "skipped": skipped,
+                         "wall_s": round(seconds, 4)}] +
+                       [{**r, "stage": f"{name} / {r['stage']}", "depth": r["depth"] + 1}
+                        for r in stages])
+        print(f"{'Skipped (unchanged)' if skipped else 'Finished'}: {name}"
+              + ("" if skipped else f" in {seconds:,.1f} s"))
+
+    with ProcessPoolExecutor(max_workers=config["workers"]) as pool:
+        while pending or running:
+            # Start (or skip) every stage whose dependencies are done
+            for name, (_, deps, in_process, _) in list(pending.items()):
+                if not all(d in results for d in deps):
+                    continue
+                del pending[name]
+                fingerprints[name] = stage_fingerprint(name, config, fingerprints)
+                if _reusable(state.get(name), fingerprints[name]):
+                    finish(name, state[name]["result"], 0.0, [], skipped=True)
+                    continue
+
+                upstream = {d: results[d] for d in deps}
+                print(f"Starting: {name}")
+                if in_process:
+                    running[pool.submit(run_stage, name, config, upstream, True)] = name
+                else:
+                    finish(name, *run_stage(name, config, upstream, active_log() is not None))
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), *future.result())
+
+    print(f"\nPipeline finished in {time.perf_counter() - started:,.1f} s")
+    run_log.write()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the demo datasets end to end.")
+    parser.add_argument("config", nargs="?", help="json config (default: CONFIG in this file)")
+    parser.add_argument("--force", action="store_true", help="re-run every stage")
+    args = parser.parse_args(argv)
+
+    config = dict(CONFIG)
+    if args.config:
+        with open(args.config) as fh:
+            config.update(json.load(fh))
+
+    results = run_pipeline(config, args.force)
+    validation = results["validate"]
+    for check, passed in validation["checks"].items():
+        print(f"  {check:<18} {passed}")
+    if validation["ok"]:
+        print("\n🎉 ALL DATASETS VALIDATED SUCCESSFULLY 🎉\n")
+    else:
+        print("\n⚠️  ONE OR MORE DATASETS FAILED VALIDATION ⚠️\n")
+    return 0 if validation["ok"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from demo_io import parse_dates, schema_dtypes
+
+
+# =========================================================
+# MEMORY-MAPPED PROXIMITY STORE
+#
+# "Proximity Data.xlsx" is converted once to an uncompressed Arrow IPC
+# file next to it (<name>.proximity.arrow), sorted by BarraId,
+# ContextualVarGroup and Date. The schema metadata carries the row
+# range of every (BarraId, ContextualVarGroup) pair and the size / mtime
+# of the xlsx it was built from. Columns get the declared Proximity
+# dtypes (demo_io.SCHEMAS), Date is parsed to datetime64. Readers map the file and slice out
+# only the ranges they need; a store older than its xlsx is rebuilt.
+#
+#   python demo_proximity.py "Proximity Data.xlsx"
+# =========================================================
+
+STORE_VERSION = 3
+KEY_COLUMNS = ["BarraId", "ContextualVarGroup"]
+BATCH_ROWS = 65_536
+
+_META_KEY = b"proximity_store"
+
+
+def proximity_store_path(xlsx_path):
+    return os.path.splitext(str(xlsx_path))[0] + ".proximity.arrow"
+
+
+def _source_stamp(xlsx_path):
+    st = os.stat(xlsx_path)
+    return {"source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+def convert_proximity(xlsx_path, store_path=None):
+    """
+    One-time conversion of the proximity workbook into the store.
+    Returns the store path.
+    """
+    import pyarrow as pa
+
+    store_path = store_path or proximity_store_path(xlsx_path)
+    stamp = _source_stamp(xlsx_path)
+
+    df = pd.read_excel(xlsx_path)
+    df = df.astype(schema_dtypes("Proximity", df.columns))
+    # Dates typed as text in the workbook come back as strings
+    df["Date"] = parse_dates(df["Date"])
+    df = df.sort_values(KEY_COLUMNS + ["Date"], kind="mergesort", ignore_index=True)
+
+    # Row range of each (BarraId, ContextualVarGroup) run in the sorted frame
+    keys = df[KEY_COLUMNS].astype(str)
+    new_run = np.ones(len(df), dtype=bool)
+    new_run[1:] = (keys.iloc[1:].to_numpy() != keys.iloc[:-1].to_numpy()).any(axis=1)
+    starts = np.flatnonzero(new_run)
+    stops = np.append(starts[1:], len(df))
+    index = [
+        [bid, group, int(start), int(stop)]
+        for (bid, group), start, stop in zip(
+            keys.iloc[starts].itertuples(index=False, name=None), starts, stops
+        )
+    ]
+
+    meta = {"version": STORE_VERSION, "source": os.path.abspath(xlsx_path), "index": index, **stamp}
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        _META_KEY: json.dumps(meta).encode("utf-8"),
+    })
+
+    tmp = f"{store_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=BATCH_ROWS)
+    os.replace(tmp, store_path)
+
+    print(f"Proximity store built → {store_path} ({len(df):,} rows, {len(index):,} series)")
+    return store_path
+
+
+class ProximityStore:
+    """
+    Read-only view of a proximity store. Slices are zero-copy on the
+    memory-mapped file until converted to pandas.
+    """
+
+    def __init__(self, store_path):
+        import pyarrow as pa
+
+        self.path = store_path
+        self._source = pa.memory_map(store_path, "r")
+        self.table = pa.ipc.open_file(self._source).read_all()
+        self.meta = json.loads(self.table.schema.metadata[_META_KEY])
+
+        self.ranges = {(bid, group): (start, stop) for bid, group, start, stop in self.meta["index"]}
+        self.by_id = {}
+        for (bid, _), (start, stop) in self.ranges.items():
+            lo, hi = self.by_id.get(bid, (start, stop))
+            self.by_id[bid] = (min(lo, start), max(hi, stop))
+
+    def is_stale(self, xlsx_path):
+        """
+        True when xlsx_path differs from the workbook the store was built from.
+        """
+        if not os.path.exists(xlsx_path):
+            return False
+        stamp = _source_stamp(xlsx_path)
+        return any(self.meta.get(k) != v for k, v in stamp.items()) or \
+            self.meta.get("version") != STORE_VERSION
+
+    def barra_ids(self):
+        return list(self.by_id)
+
+    def scale_table(self):
+        """
+        smart_scale_table of the whole store, memoized on disk
+        (demo_cache) by the store's contents. Indexed by (BarraId,
+        ContextualVarGroup).
+        """
+        from demo_cache import cached_frame
+
+        return cached_frame(self.path, _store_scale_table).set_index(KEY_COLUMNS)
+
+    def read(self, barra_ids=None, groups=None, columns=None):
+        """
+        Rows of the given BarraIds and/or ContextualVarGroups (all if
+        None), only the given columns, in (BarraId, group, Date) order.
+        """
+        import pyarrow as pa
+
+        if barra_ids is None and groups is None:
+            table = self.table
+        else:
+            if groups is None:
+                ranges = [self.by_id[b] for b in barra_ids if b in self.by_id]
+            else:
+                ids = self.by_id if barra_ids is None else barra_ids
+                ranges = [self.ranges[(b, g)] for b in ids for g in groups if (b, g) in self.ranges]
+            ranges.sort()
+            parts = [self.table.slice(start, stop - start) for start, stop in ranges]
+            table = pa.concat_tables(parts) if parts else self.table.slice(0, 0)
+
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+
+
+# -------------------------------------
+# Smart y-axis scaling
+# -------------------------------------
+def smart_scale_table(df, values="value"):
+    """
+    Y-limits of every (BarraId, ContextualVarGroup) series of a long
+    frame, from one groupby min/max:
+      - entirely negative → (min * 1.10, max * 0.90)
+      - entirely positive → (min * 0.90, max * 1.10)
+      - crosses zero      → (-1, 1)
+    with ymin < ymax guaranteed. Columns BarraId, ContextualVarGroup,
+    ymin, ymax.
+    """
+    stats = df.groupby(KEY_COLUMNS, observed=True)[values].agg(["min", "max"])
+    smin = stats["min"].to_numpy()
+    smax = stats["max"].to_numpy()
+
+    negative = smax <= 0
+    positive = ~negative & (smin >= 0)
+    ymin = np.where(negative, smin * 1.10, np.where(positive, smin * 0.90, -1.0))
+    ymax = np.where(negative, smax * 0.90, np.where(positive, smax * 1.10, 1.0))
+
+    out = stats.index.to_frame(index=False)
+    out["ymin"] = np.minimum(ymin, ymax)
+    out["ymax"] = np.maximum(ymin, ymax)
+    return out
+
+
+def _store_scale_table(store_path):
+    return smart_scale_table(ProximityStore(store_path).read(columns=KEY_COLUMNS + ["value"]))
+
+
+class SecurityPanels:
+    """
+    Per-security lookup over a long proximity frame (BarraId, Date,
+    ContextualVarGroup, value). The frame is pivoted once to one row per
+    (BarraId, Date) and one column per ContextualVarGroup, sorted by
+    BarraId; each security is then a contiguous row range, so pivot(bid)
+    is a slice instead of a scan of the whole frame.
+    """
+
+    def __init__(self, df, values="value"):
+        wide = (
+            df.set_index(["BarraId", "Date", "ContextualVarGroup"])[values]
+            .unstack("ContextualVarGroup")
+            .sort_index()
+        )
+        wide.columns.name = "ContextualVarGroup"
+
+        ids = wide.index.get_level_values("BarraId")
+        codes, uniques = pd.factorize(ids, sort=True)
+        starts = np.searchsorted(codes, np.arange(len(uniques)), side="left")
+        stops = np.searchsorted(codes, np.arange(len(uniques)), side="right")
+
+        self.wide = wide.droplevel("BarraId")
+        self.offsets = dict(zip(uniques.tolist(), zip(starts.tolist(), stops.tolist())))
+
+    def __contains__(self, bid):
+        return bid in self.offsets
+
+    def pivot(self, bid):
+        """
+        Date × ContextualVarGroup values of one security, like
+        df[df["BarraId"] == bid].pivot(index="Date", columns=..., values=...),
+        without the groups that security has no values for.
+        """
+        start, stop = self.offsets[bid]
+        return self.wide.iloc[start:stop].dropna(axis=1, how="all")
+
+
+def open_proximity(xlsx_path, store_path=None):
+    """
+    The ProximityStore for xlsx_path, converting it first if the store
+    is missing or older than the workbook.
+    """
+    store_path = store_path or proximity_store_path(xlsx_path)
+
+    if os.path.exists(store_path):
+        store = ProximityStore(store_path)
+        if not store.is_stale(xlsx_path):
+            return store
+        print(f"Proximity store is stale, rebuilding: {store_path}")
+        del store
+
+    convert_proximity(xlsx_path, store_path)
+    return ProximityStore(store_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert the Proximity Data workbook into a memory-mapped store."
+    )
+    parser.add_argument("xlsx", help="Proximity Data.xlsx")
+    parser.add_argument("-o", "--output", help="store path (default: next to the workbook)")
+    args = parser.parse_args(argv)
+
+    convert_proximity(args.xlsx, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from demo_calendar import available_calendars, demo_business_days
+from demo_io import (EXPORT_FORMATS, SCHEMAS, check_chunked, chunk_writer, read_long, schema_dtypes,
+                     write_demo)
+from demo_trace import traced
+
+
+# =========================================================
+# SHARED DATE-REBASE LIBRARY
+#
+# One real→demo date-map kernel for every long-format file
+# (Combined_Long alphas, Weights_Long, ...). Import it from the
+# rebase scripts, or run it directly:
+#
+#   python demo_rebase.py INPUT.csv.gz --real-end 2025-10-27 --demo-end 2025-11-17
+# =========================================================
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+# =========================================================
+# DATE-MAP KERNEL
+# =========================================================
+def unique_dates(values):
+    """
+    Sorted distinct dates of a column. Only the distinct values are
+    parsed, so this costs O(unique dates), not O(rows).
+    """
+    uniques = pd.unique(pd.Series(values).dropna())
+    parsed = pd.to_datetime(pd.Series(uniques)).drop_duplicates()
+    return pd.DatetimeIndex(parsed.sort_values()).as_unit("ns")
+
+
+@traced(rows=len)
+def build_date_map(real_dates, real_end, demo_end, calendar=None):
+    """
+    Map every unique real date <= real_end onto a business-day demo
+    timeline ending on demo_end: weekdays only, minus the holidays of
+    `calendar` (e.g. "US") when one is given.
+
+    Returns a DataFrame with columns Date (real) and date_demo, sorted
+    by Date.
+    """
+    real = unique_dates(real_dates)
+    real = real[real <= pd.Timestamp(real_end)]
+
+    demo = demo_business_days(demo_end, len(real), calendar)
+
+    return pd.DataFrame({
+        "Date": real,
+        "date_demo": demo
+    })
+
+
+def apply_date_map(values, date_map, src="Date", dst="date_demo"):
+    """
+    Vectorized lookup of values through date_map (src → dst).
+
+    The column is factorized, the few distinct keys are located with
+    searchsorted in the sorted src array, and the result is broadcast
+    back through the integer codes. No merge, no copy of the frame.
+    Values missing from the map come back as NaT.
+
+    Pass src="date_demo", dst="Date" for the reverse (demo → real) lookup.
+    """
+    codes, uniques = pd.factorize(pd.Series(values))
+    keys = pd.to_datetime(pd.Series(uniques)).to_numpy(dtype="datetime64[ns]")
+
+    ordered = date_map.sort_values(src)
+    real = ordered[src].to_numpy(dtype="datetime64[ns]")
+    demo = ordered[dst].to_numpy(dtype="datetime64[ns]")
+
+    mapped = np.full(len(keys), np.datetime64("NaT"), dtype="datetime64[ns]")
+    if len(real):
+        pos = np.minimum(np.searchsorted(real, keys), len(real) - 1)
+        hit = real[pos] == keys
+        mapped[hit] = demo[pos[hit]]
+
+    out = mapped[codes]
+    out[codes < 0] = np.datetime64("NaT")
+    return out
+
+
+def rebase_frame(df, date_map, date_col="Date"):
+    """
+    Keep only the rows whose date is in date_map and replace date_col
+    with the demo date. Column order is preserved.
+    """
+    date_demo = apply_date_map(df[date_col], date_map)
+    keep = ~np.isnat(date_demo)
+
+    out = df.take(np.flatnonzero(keep))
+    out[date_col] = date_demo[keep]
+    return out
+
+
+# =========================================================
+# STREAMING (TWO-PASS, CHUNKED)
+# =========================================================
+@traced(rows=len)
+def read_unique_dates(path, date_col="Date", chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Pass 1: read only date_col, chunk by chunk, and return the sorted
+    distinct dates.
+    """
+    seen = set()
+    for chunk in pd.read_csv(path, usecols=[date_col], dtype={date_col: str},
+                             chunksize=chunksize):
+        seen.update(chunk[date_col].dropna().unique())
+    return unique_dates(list(seen))
+
+
+def write_rebased(chunks, write, date_map, date_col="Date", on_chunk=None, verifier=None):
+    """
+    Filter and remap each real-dated chunk and pass it to write(chunk).
+
+    on_chunk(chunk, date_demo), if given, sees every kept chunk while it
+    still carries the real dates, e.g. to collect confirmation rows.
+    verifier (demo_verify.ExportVerifier), if given, checks every chunk
+    as it is written.
+
+    Returns (rows_in, rows_out).
+    """
+    rows_in = rows_out = 0
+
+    for chunk in chunks:
+        rows_in += len(chunk)
+
+        date_demo = apply_date_map(chunk[date_col], date_map)
+        keep = ~np.isnat(date_demo)
+        chunk = chunk.take(np.flatnonzero(keep))
+        date_demo = date_demo[keep]
+
+        if on_chunk is not None:
+            on_chunk(chunk, date_demo)
+
+        real_dates = chunk[date_col]
+        chunk[date_col] = date_demo
+        if verifier is not None:
+            verifier.update(chunk, real_dates)
+        write(chunk)
+        rows_out += len(chunk)
+
+    return rows_in, rows_out
+
+
+@traced(rows=lambda counts: counts[1])
+def stream_rebase(path, out_path, date_map, date_col="Date",
+                  chunksize=DEFAULT_CHUNK_SIZE, on_chunk=None, verifier=None,
+                  workers=1, schema=None):
+    """
+    Pass 2: filter, remap and write each chunk straight to out_path
+    (csv, csv.gz or parquet by extension). Peak memory is bounded by
+    chunksize. on_chunk and verifier as in write_rebased; workers > 1
+    compresses csv.gz output in parallel. schema (a SCHEMAS name) types
+    every chunk the same way, whatever values a chunk happens to hold.
+
+    Returns (rows_in, rows_out).
+    """
+    dtype = {**schema_dtypes(schema), date_col: str}
+    with chunk_writer(out_path, verifier, workers, schema=schema) as write:
+        chunks = pd.read_csv(path, dtype=dtype, chunksize=chunksize)
+        return write_rebased(chunks, write, date_map, date_col, on_chunk, verifier)
+
+
+# =========================================================
+# COMMAND LINE
+# =========================================================
+def default_output_path(input_path, demo_end, ts, fmt="csv.gz"):
+    """
+    <input stem>_DEMO_ending_<demo_end>_<ts>.<fmt> in the working directory.
+    """
+    stem = str(input_path).replace("\\", "/").rsplit("/", 1)[-1]
+    for ext in (".gz", ".csv"):
+        if stem.endswith(ext):
+            stem = stem[: -len(ext)]
+    return f"{stem}_DEMO_ending_{pd.Timestamp(demo_end).date()}_{ts}.{fmt}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rebase a long-format file onto a business-day demo timeline."
+    )
+    parser.add_argument("input", help="long-format csv / csv.gz with a Date column")
+    parser.add_argument("--real-end", required=True, help="last real date to keep")
+    parser.add_argument("--demo-end", required=True, help="demo timeline end date")
+    parser.add_argument("--calendar", choices=available_calendars(),
+                        help="holiday calendar of the demo timeline (default: weekends only)")
+    parser.add_argument("-o", "--output", help="demo export path (default: derived from input)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv.gz",
+                        help="demo export format when --output is not given")
+    parser.add_argument("--map-out", help="also write the real→demo date map as csv")
+    parser.add_argument("--date-map",
+                        help="canonical date map json (demo_datemap.py) to apply instead "
+                             "of building one from the input")
+    parser.add_argument("--date-col", default="Date")
+    parser.add_argument("--schema", choices=list(SCHEMAS),
+                        help="declared dtypes of the input (default: inferred)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="two-pass chunked mode, memory bounded by --chunk-size")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parallel gzip compression threads for csv.gz output")
+    args = parser.parse_args(argv)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = args.output or default_output_path(args.input, args.demo_end, ts, args.format)
+    if args.streaming:
+        check_chunked(output)
+
+    date_map = None
+    if args.date_map:
+        from demo_datemap import load_date_map
+
+        date_map = load_date_map(args.date_map, args.real_end, args.demo_end, args.calendar)
+
+    if args.streaming:
+        if date_map is None:
+            real_dates = read_unique_dates(args.input, args.date_col, args.chunk_size)
+            date_map = build_date_map(real_dates, args.real_end, args.demo_end, args.calendar)
+        rows_in, rows_out = stream_rebase(args.input, output, date_map,
+                                          args.date_col, args.chunk_size,
+                                          workers=args.workers, schema=args.schema)
+    else:
+        df = read_long(args.input, date_col=args.date_col, schema=args.schema)
+        if date_map is None:
+            date_map = build_date_map(df[args.date_col], args.real_end, args.demo_end,
+                                      args.calendar)
+        df_export = rebase_frame(df, date_map, args.date_col)
+        rows_in, rows_out = len(df), len(df_export)
+        del df
+        write_demo(df_export, output, workers=args.workers)
+
+    print(f"Rows in: {rows_in:,}  rows out: {rows_out:,}")
+    print("Demo dates span:", date_map["date_demo"].min(), "→", date_map["date_demo"].max())
+    print(f"Demo export complete → {output}")
+
+    if args.map_out:
+        date_map.to_csv(args.map_out, index=False)
+        print(f"Date mapping exported → {args.map_out}")
+
+    return date_map
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from demo_io import write_demo
+from demo_trace import traced
+
+
+# =========================================================
+# SIZE-BOUNDED EXCEL REPORTS
+#
+# Only summary sheets go to Excel, written row by row through
+# xlsxwriter in constant_memory mode. Row-level detail goes to a
+# columnar side file. Any sheet longer than max_rows is evenly
+# sampled down to max_rows and flagged on the Notes sheet.
+# =========================================================
+
+# Excel's hard limit is 1,048,576 rows including the header
+EXCEL_MAX_ROWS = 1_048_575
+DEFAULT_SHEET_ROWS = 100_000
+
+
+def bounded(df, max_rows):
+    """
+    df itself if it fits, else max_rows rows evenly spaced across it
+    (first and last rows included).
+    """
+    if len(df) <= max_rows:
+        return df
+    idx = np.unique(np.linspace(0, len(df) - 1, max_rows).round().astype(np.int64))
+    return df.iloc[idx]
+
+
+def _cell(value):
+    """
+    Value as xlsxwriter can store it: NaN/NaT → None, containers → str.
+    """
+    if isinstance(value, (list, tuple, set, dict)):
+        return str(value)
+    if value is None or (np.ndim(value) == 0 and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_sheet(workbook, name, df, date_format):
+    """
+    Header + rows, strictly in row order (required by constant_memory).
+    """
+    ws = workbook.add_worksheet(name[:31])
+    ws.write_row(0, 0, [str(c) for c in df.columns])
+
+    # uint64 hashes do not survive Excel's float64 cells
+    df = df.astype({c: str for c in df.columns if df[c].dtype == np.uint64})
+
+    is_date = [pd.api.types.is_datetime64_any_dtype(df[c]) for c in df.columns]
+    for c, flag in enumerate(is_date):
+        if flag:
+            ws.set_column(c, c, 12, date_format)
+
+    for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        for c, value in enumerate(row):
+            value = _cell(value)
+            if value is None:
+                continue
+            if is_date[c]:
+                ws.write_datetime(r, c, value, date_format)
+            else:
+                ws.write(r, c, value)
+
+
+@traced()
+def write_report(path, sheets, detail=None, detail_path=None, max_rows=DEFAULT_SHEET_ROWS):
+    """
+    Write the summary `sheets` (name → DataFrame) to the Excel file at
+    path, and the row-level `detail` frame to detail_path (parquet,
+    feather or csv.gz by extension).
+
+    Returns {sheet name: rows written} for the sheets that were sampled.
+    """
+    import xlsxwriter
+
+    max_rows = min(max_rows, EXCEL_MAX_ROWS)
+    sampled = {}
+    notes = []
+
+    if detail is not None and detail_path is not None:
+        write_demo(detail, detail_path)
+        notes.append({"Item": "Row-level detail", "Value": detail_path})
+        notes.append({"Item": "Row-level detail rows", "Value": len(detail)})
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    try:
+        for name, df in sheets.items():
+            out = bounded(df, max_rows)
+            if len(out) < len(df):
+                sampled[name] = len(out)
+                notes.append({
+                    "Item": f"{name} sampled",
+                    "Value": f"{len(out):,} of {len(df):,} rows (evenly spaced)"
+                })
+            _write_sheet(workbook, name, out, date_format)
+
+        if notes:
+            _write_sheet(workbook, "Notes", pd.DataFrame(notes), date_format)
+    finally:
+        workbook.close()
+
+    return sampled
@@ -0,0 +1,281 @@
+import functools
+import json
+import os
+import re
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# =========================================================
+# PER-STAGE INSTRUMENTATION
+#
+# A RunLog records, for every stage of a run: wall time, CPU time,
+# growth of the peak RSS, current RSS and a row count, and writes them
+# as a json run log next to the outputs. Stages are opened three ways:
+#
+#   run_log.step("3. Filter")          in the flat scripts: closes the
+#                                      previous step, opens the next
+#   with run_log.stage("export"):      around any block
+#   @traced()                          on library functions; recorded
+#                                      only while a run log is active
+#
+# profile="cprofile" dumps a .prof file per top-level stage (open with
+# pstats / snakeviz), profile="tracemalloc" the top allocation sites
+# and the traced peak. Both slow the run down; the default is off.
+# =========================================================
+
+PROFILES = (None, "cprofile", "tracemalloc")
+TRACEMALLOC_TOP = 25
+
+_active = None
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if os.uname().sysname == "Darwin" else peak / 1024
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+def _safe_name(name):
+    return re.sub(r"\W+", "_", name).strip("_")
+
+
+class RunLog:
+    """
+    Stage records of one run. path is the json log to write; profile
+    dumps go next to it.
+    """
+
+    def __init__(self, run, path=None, profile=None):
+        if profile not in PROFILES:
+            raise ValueError(f"profile must be one of {PROFILES}, got {profile!r}")
+        self.run = run
+        self.path = path
+        self.profile = profile
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.records = []
+        self.thread = threading.get_ident()
+        self._stack = []
+        self._step = None
+
+    # -------------------------------------
+    # Stages
+    # -------------------------------------
+    def _open(self, name):
+        parent = self._stack[-1]["record"] if self._stack else None
+        record = {
+            "stage": name if parent is None else f"{parent['stage']} / {name}",
+            "depth": len(self._stack),
+            "rows": None,
+        }
+        self.records.append(record)
+
+        frame = {"record": record, "profiler": None}
+        if self.profile and not self._stack:
+            frame["profiler"] = self._start_profile()
+        self._stack.append(frame)
+
+        frame["peak0"] = _peak_rss_mb()
+        frame["cpu0"] = time.process_time()
+        frame["t0"] = time.perf_counter()
+        return record
+
+    def _close(self):
+        frame = self._stack.pop()
+        record = frame["record"]
+        record["wall_s"] = round(time.perf_counter() - frame["t0"], 4)
+        record["cpu_s"] = round(time.process_time() - frame["cpu0"], 4)
+        record["peak_rss_delta_mb"] = round(_peak_rss_mb() - frame["peak0"], 1)
+        rss = _rss_mb()
+        record["rss_mb"] = round(rss, 1) if rss is not None else None
+        if frame["profiler"] is not None:
+            self._stop_profile(frame["profiler"], record)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Record the block as one stage; yields its record (set
+        record["rows"] inside the block if rows is not known upfront).
+        """
+        record = self._open(name)
+        record["rows"] = rows
+        try:
+            yield record
+        finally:
+            self._close()
+
+    def step(self, name, rows=None):
+        """
+        Close the current step (if any) and open the next one.
+        """
+        self.end_step()
+        self._step = self._open(name)
+        self._step["rows"] = rows
+        return self._step
+
+    def rows(self, n):
+        """
+        Row count of the innermost open stage.
+        """
+        if self._stack:
+            self._stack[-1]["record"]["rows"] = int(n)
+
+    def end_step(self):
+        if self._step is not None:
+            while self._stack and self._stack[-1]["record"] is not self._step:
+                self._close()
+            self._close()
+            self._step = None
+
+    def extend(self, records):
+        """
+        Add records measured elsewhere (e.g. in a worker process) as
+        sub-stages of the innermost open stage.
+        """
+        parent = self._stack[-1]["record"] if self._stack else None
+        for record in records:
+            if parent is not None:
+                record = {**record, "stage": f"{parent['stage']} / {record['stage']}",
+                          "depth": parent["depth"] + 1 + record["depth"]}
+            self.records.append(record)
+
+    # -------------------------------------
+    # Profiling
+    # -------------------------------------
+    def _start_profile(self):
+        if self.profile == "cprofile":
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+
+        import tracemalloc
+
+        tracemalloc.start()
+        return tracemalloc
+
+    def _dump_path(self, record, ext):
+        stem = os.path.splitext(self.path or self.run)[0]
+        return f"{stem}_{_safe_name(record['stage'])}.{ext}"
+
+    def _stop_profile(self, profiler, record):
+        if self.profile == "cprofile":
+            profiler.disable()
+            path = self._dump_path(record, "prof")
+            profiler.dump_stats(path)
+        else:
+            snapshot = profiler.take_snapshot().filter_traces(
+                [profiler.Filter(False, __file__)]
+            )
+            _, peak = profiler.get_traced_memory()
+            profiler.stop()
+            record["traced_peak_mb"] = round(peak / 2**20, 1)
+            path = self._dump_path(record, "tracemalloc.txt")
+            with open(path, "w") as fh:
+                for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                    fh.write(f"{stat}\n")
+        record["profile"] = path
+
+    # -------------------------------------
+    # Output
+    # -------------------------------------
+    def table(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.records)
+
+    def write(self, path=None):
+        """
+        Close any open step and write the json run log. Returns its path.
+        """
+        self.end_step()
+        path = path or self.path or f"{self.run}_RUNLOG.json"
+        log = {
+            "run": self.run,
+            "started": self.started,
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "profile": self.profile,
+            "stages": self.records,
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(log, fh, indent=1, default=str)
+        os.replace(tmp, path)
+        print(f"Run log exported → {path}")
+        return path
+
+
+# =========================================================
+# ACTIVE RUN LOG
+# =========================================================
+def start_run(run, path=None, profile=None):
+    """
+    Create the run log that @traced functions record into.
+    """
+    global _active
+    _active = RunLog(run, path, profile)
+    return _active
+
+
+def active_log():
+    return _active
+
+
+@contextmanager
+def collect_stages(enabled=None):
+    """
+    Record the stages of the block into a separate list (yielded), for
+    worker functions whose records travel back to the parent. enabled
+    defaults to whether a run log is active; pass the parent's answer
+    in spawned workers, which start without one.
+    """
+    global _active
+    outer = _active
+    if not (outer is not None if enabled is None else enabled):
+        yield []
+        return
+
+    # (no profiling: the block may run inside a profiled stage)
+    _active = RunLog(outer.run if outer is not None else "worker")
+    try:
+        yield _active.records
+    finally:
+        _active = outer
+
+
+def traced(name=None, rows=None):
+    """
+    Decorator: record each call as a stage of the active run log (a
+    plain call when there is none, or from another thread: the stage
+    stack belongs to the thread that started the run). rows(result), if
+    given, is the row count of the stage.
+    """
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            log = _active
+            if log is None or log.thread != threading.get_ident():
+                return func(*args, **kwargs)
+            with log.stage(stage_name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record["rows"] = int(rows(result))
+            return result
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,255 @@
+import hashlib
+import struct
+import zlib
+import numpy as np
+import pandas as pd
+
+from demo_io import file_format, parse_dates
+from demo_trace import traced
+
+
+# =========================================================
+# IN-FLIGHT EX-POST VERIFICATION
+#
+# Checks a demo export while it is being written, instead of
+# re-reading the whole file afterwards:
+#   - rows and per-date row counts / row hashes
+#   - a digest of the observed (real, demo) date pairs, compared
+#     with the digest of the date map
+#   - CRC32 + length of the exact csv bytes written (gzip trailer)
+# sample_reread() then looks at a few byte ranges of the finished
+# file only (head, gzip trailer, parquet footer / row groups).
+# =========================================================
+
+
+def date_map_digest(real_dates, demo_dates):
+    """
+    sha256 over the sorted (real, demo) date pairs as int64 nanoseconds.
+    """
+    pairs = np.column_stack([
+        np.asarray(real_dates, dtype="datetime64[ns]").view("i8"),
+        np.asarray(demo_dates, dtype="datetime64[ns]").view("i8"),
+    ])
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    return hashlib.sha256(np.ascontiguousarray(pairs).tobytes()).hexdigest()
+
+
+def demo_dates_digest(demo_dates):
+    """
+    sha256 over the sorted distinct demo dates as int64 nanoseconds:
+    equal digests ⇔ identical demo calendars.
+    """
+    days = np.unique(np.asarray(demo_dates, dtype="datetime64[ns]").view("i8"))
+    return hashlib.sha256(days.tobytes()).hexdigest()
+
+
+class ExportVerifier:
+    """
+    Accumulates checks over the chunks of one demo export.
+
+    Call update(chunk, real_dates) with every chunk after its date column
+    was swapped to demo dates (real_dates = the dates it replaced), and
+    update_bytes(data) with the raw csv bytes if the file is csv.
+    """
+
+    def __init__(self, date_map, date_col="Date"):
+        ordered = date_map.sort_values("Date")
+        self.date_col = date_col
+        self.real = ordered["Date"].to_numpy(dtype="datetime64[ns]")
+        self.demo = ordered["date_demo"].to_numpy(dtype="datetime64[ns]")
+        self.map_digest = date_map_digest(self.real, self.demo)
+
+        self.columns = None
+        self.rows = 0
+        self.date_rows = np.zeros(len(self.demo), dtype=np.int64)
+        self.date_hash = np.zeros(len(self.demo), dtype=np.uint64)
+        self.pairs = set()
+        self.unmapped_rows = 0
+        self.carried_rows = 0
+        self.content = hashlib.sha256()
+
+        self.crc32 = 0
+        self.nbytes = 0
+        self.member_crc32 = 0
+        self.member_nbytes = 0
+
+    # -------------------------------------
+    # Accumulation
+    # -------------------------------------
+    def _positions(self, sorted_dates, values):
+        """
+        Index of every value in sorted_dates, -1 where it is absent.
+        """
+        values = np.asarray(values, dtype="datetime64[ns]")
+        if not len(sorted_dates):
+            return np.full(len(values), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_dates, values), len(sorted_dates) - 1)
+        return np.where(sorted_dates[pos] == values, pos, -1)
+
+    def update(self, chunk, real_dates):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        self.rows += len(chunk)
+
+        pos_demo = self._positions(self.demo, chunk[self.date_col])
+        pos_real = self._positions(self.real, parse_dates(pd.Series(real_dates)))
+
+        ok = pos_demo >= 0
+        self.unmapped_rows += int(((pos_demo < 0) | (pos_real < 0)).sum())
+
+        row_hash = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        self.content.update(row_hash.tobytes())
+
+        self.date_rows += np.bincount(pos_demo[ok], minlength=len(self.demo))
+        np.add.at(self.date_hash, pos_demo[ok], row_hash[ok])
+
+        m = len(self.demo) + 1
+        self.pairs.update(pd.unique((pos_real + 1) * m + (pos_demo + 1)).tolist())
+
+    def carry(self, per_date, columns):
+        """
+        Account for rows kept byte-for-byte from a previous export instead
+        of being written again. per_date has the layout of per_date()
+        (Date_real, Date_demo, Rows, RowHash) for those rows.
+        """
+        if self.columns is None:
+            self.columns = list(columns)
+
+        rows = per_date["Rows"].to_numpy(dtype=np.int64)
+        pos_demo = self._positions(self.demo, per_date["Date_demo"])
+        pos_real = self._positions(self.real, per_date["Date_real"])
+
+        ok = pos_demo >= 0
+        self.rows += int(rows.sum())
+        self.carried_rows += int(rows.sum())
+        self.unmapped_rows += int(rows[(pos_demo < 0) | (pos_real < 0)].sum())
+
+        np.add.at(self.date_rows, pos_demo[ok], rows[ok])
+        np.add.at(self.date_hash, pos_demo[ok], per_date["RowHash"].to_numpy(dtype=np.uint64)[ok])
+
+        m = len(self.demo) + 1
+        self.pairs.update(np.unique((pos_real + 1) * m + (pos_demo + 1)).tolist())
+
+    def update_bytes(self, data, new_member=False):
+        """
+        new_member=True when data starts a new gzip member (parallel
+        gzip); the member CRC32 / length are what its trailer holds.
+        """
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.nbytes += len(data)
+
+        if new_member:
+            self.member_crc32, self.member_nbytes = 0, 0
+        self.member_crc32 = zlib.crc32(data, self.member_crc32)
+        self.member_nbytes += len(data)
+
+    # -------------------------------------
+    # Results
+    # -------------------------------------
+    def pairs_digest(self):
+        """
+        date_map_digest of the (real, demo) pairs actually written.
+        """
+        m = len(self.demo) + 1
+        codes = np.fromiter(self.pairs, dtype=np.int64, count=len(self.pairs))
+        pos_real, pos_demo = codes // m - 1, codes % m - 1
+        valid = (pos_real >= 0) & (pos_demo >= 0)
+        return date_map_digest(self.real[pos_real[valid]], self.demo[pos_demo[valid]])
+
+    def per_date(self):
+        """
+        One row per mapped date: real date, demo date, rows written and
+        the order-independent sum of their row hashes.
+        """
+        return pd.DataFrame({
+            "Date_real": self.real,
+            "Date_demo": self.demo,
+            "Rows": self.date_rows,
+            "RowHash": self.date_hash,
+        })
+
+    def summary(self):
+        """
+        Check / Result table, in the same layout as the business-day checks.
+        """
+        empty_dates = int((self.date_rows == 0).sum())
+        digest = self.pairs_digest()
+        weekdays = bool((pd.DatetimeIndex(self.demo).weekday <= 4).all())
+
+        checks = [
+            {"Check": "Rows written", "Result": self.rows},
+            {"Check": "Rows outside the date map", "Result": self.unmapped_rows},
+            {"Check": "Mapped dates with no rows", "Result": empty_dates},
+            {"Check": "Demo dates weekdays only", "Result": weekdays},
+            {"Check": "Date-pair digest matches date map", "Result": digest == self.map_digest},
+            {"Check": "Date-pair digest", "Result": digest},
+            {"Check": "Content sha256", "Result": self.content.hexdigest()},
+            {"Check": "CSV bytes written", "Result": self.nbytes},
+            {"Check": "CSV CRC32", "Result": f"{self.crc32:08x}"},
+        ]
+        if self.carried_rows:
+            checks.insert(1, {"Check": "Rows carried over unchanged", "Result": self.carried_rows})
+        return pd.DataFrame(checks)
+
+    def ok(self):
+        return (
+            self.unmapped_rows == 0 and
+            not (self.date_rows == 0).any() and
+            self.pairs_digest() == self.map_digest
+        )
+
+
+# =========================================================
+# CHEAP SAMPLE RE-READ
+# =========================================================
+@traced()
+def sample_reread(path, verifier, sample_rows=1_000):
+    """
+    Spot-check the finished file against the verifier without a full
+    second pass: the header and first rows, the gzip trailer (CRC32 and
+    length of the last gzip member written) or the parquet footer and the
+    first and last row groups.
+    """
+    fmt = file_format(path)
+    demo = pd.DatetimeIndex(verifier.demo)
+    checks = []
+
+    def dates_ok(values):
+        return bool(parse_dates(values).isin(demo).all())
+
+    if fmt == "csv":
+        head = pd.read_csv(path, nrows=sample_rows)
+        checks.append({"Check": "Header matches", "Result": list(head.columns) == verifier.columns})
+        checks.append({"Check": "Head rows on demo calendar", "Result": dates_ok(head[verifier.date_col])})
+
+        if str(path).endswith(".gz"):
+            with open(path, "rb") as fh:
+                fh.seek(-8, 2)
+                crc, isize = struct.unpack("<II", fh.read(8))
+            checks.append({"Check": "gzip trailer CRC32 matches",
+                           "Result": crc == verifier.member_crc32})
+            checks.append({"Check": "gzip trailer length matches",
+                           "Result": isize == verifier.member_nbytes % 2**32})
+
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        checks.append({"Check": "Footer row count matches", "Result": pf.metadata.num_rows == verifier.rows})
+        checks.append({"Check": "Schema matches", "Result": pf.schema_arrow.names == verifier.columns})
+        for i in sorted({0, pf.num_row_groups - 1}):
+            group = pf.read_row_group(i, columns=[verifier.date_col]).to_pandas()
+            checks.append({"Check": f"Row group {i} on demo calendar",
+                           "Result": dates_ok(group[verifier.date_col])})
+
+    elif fmt == "feather":
+        import pyarrow as pa
+
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            checks.append({"Check": "Schema matches", "Result": reader.schema.names == verifier.columns})
+            last = reader.get_batch(reader.num_record_batches - 1).to_pandas()
+            checks.append({"Check": "Last batch on demo calendar",
+                           "Result": dates_ok(last[verifier.date_col])})
+
+    return pd.DataFrame(checks)
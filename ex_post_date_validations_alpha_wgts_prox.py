@@ -1,65 +1,193 @@
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import json
 import os
+import re
+import sys
+import time
+
+from demo_cache import cached_frame
+from demo_calendar import load_holidays
+from demo_datemap import read_date_map
+from demo_io import TASK_COLUMNS, file_format, iter_demo
+from demo_proximity import open_proximity
+from demo_rebase import unique_dates
+from demo_trace import active_log, start_run, traced
+from demo_verify import demo_dates_digest
 
 
 # =========================================================
 # CONFIG — EDIT THESE PATHS ONLY
+# (csv.gz, parquet, feather or xlsx — picked from the extension)
 # =========================================================
 DEMO_COMBINED = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Global_LC_Combined_Long_DEMO_ending_2025-11-17_20251116_143315.csv.gz"
 DEMO_WEIGHTS  = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Global_LC_Weights_Long_DEMO_ending_2025-11-17_20251116_153325.csv.gz"
 PROXIMITY_FILE = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Proximity Data.xlsx"
 
-OUTPUT_ROOT = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/expost_validation/"
-# =========================================================
+# Datasets to validate, in dashboard order: name (sheet prefix) and path
+# of each; "store": False reads a workbook that is not Proximity data
+# with pandas instead of the Proximity store. SOURCES_MANIFEST (or a
+# path given on the command line) replaces the list with a json file of
+# the same entries, so new demo datasets need no edit here.
+SOURCES = [
+    {"name": "Combined_Long", "path": DEMO_COMBINED},
+    {"name": "Weights_Long",  "path": DEMO_WEIGHTS},
+    {"name": "Proximity",     "path": PROXIMITY_FILE},     # Excel, or a columnar copy of it
+]
+SOURCES_MANIFEST = None
 
+OUTPUT_ROOT = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/expost_validation/"
 
-os.makedirs(OUTPUT_ROOT, exist_ok=True)
+# Only the Date column is read, CHUNK_SIZE rows at a time; the sources
+# are read concurrently by VALIDATION_WORKERS threads (decompression and
+# parsing release the GIL; 1 = one after another)
+CHUNK_SIZE = 2_000_000
+VALIDATION_WORKERS = 3
+
+# Memoize the per-date row counts of each file on disk (demo_cache),
+# keyed by its contents: unchanged exports are not read again
+SCAN_CACHE = True
+
+# Read the Proximity workbook through its memory-mapped store
+# (demo_proximity), built once and rebuilt when the xlsx changes
+PROXIMITY_STORE = True
+
+# Holiday calendar the demo timeline was built on (DEMO_CALENDAR of the
+# rebase scripts): None (weekends only) or a name under calendars/
+DEMO_CALENDAR = None
+
+# Canonical date map the exports were rebased with (demo_datemap.py):
+# every dataset's demo dates must hash to its demo_digest. None checks
+# the datasets against each other instead.
+DATE_MAP_PATH = None
+
+# Run log (wall / CPU time, peak RSS growth, rows per stage) written to
+# OUTPUT_ROOT. PROFILE adds a dump per stage: None, "cprofile" (.prof
+# files) or "tracemalloc" (top allocation sites)
+PROFILE = None
+# =========================================================
 
 
 
 # =========================================================
 # CANONICAL BUSINESS-DAY CHECK
 # =========================================================
-def check_business_days_canonical(canon_dates, prefix):
+def _day_runs(days):
+    """
+    Group sorted, unique datetime64[D] days into runs of consecutive
+    calendar days → [(start, end, n_days), ...].
+    """
+    if not len(days):
+        return []
+    breaks = np.flatnonzero(np.diff(days.astype(np.int64)) != 1) + 1
+    starts = np.r_[0, breaks]
+    ends = np.r_[breaks, len(days)] - 1
+    return list(zip(days[starts], days[ends], ends - starts + 1))
+
+
+def _format_range(start, end, n):
+    if start == end:
+        return str(start)
+    return f"{start} → {end} ({n} days)"
+
+
+def check_business_days_canonical(canon_dates, prefix, holidays=None):
     """
     Canonical business-day validation, printed to terminal and
     returned for Excel export.
+
+    Vectorized on int64 day numbers (np.busday_count / np.diff over the
+    sorted dates). Gaps, duplicates and out-of-calendar dates are reported
+    as ranges. holidays (optional array of dates) are treated as
+    non-business days on top of weekends.
     """
     print(f"\n----- BUSINESS DAY CHECK (CANONICAL): {prefix} -----")
 
-    canon_dates = pd.to_datetime(canon_dates).sort_values().reset_index(drop=True)
+    days = np.sort(pd.to_datetime(pd.Series(canon_dates)).to_numpy(dtype="datetime64[D]"))
+    hol = (
+        np.unique(pd.to_datetime(pd.Series(holidays)).to_numpy(dtype="datetime64[D]"))
+        if holidays is not None else np.array([], dtype="datetime64[D]")
+    )
+
+    # Duplicates — sorted input, so equal neighbours
+    uniq = np.unique(days)
+    duplicates = _day_runs(np.unique(days[1:][np.diff(days.astype(np.int64)) == 0]))
 
     # 1 — Weekday check
-    weekday_flags = canon_dates.dt.weekday
-    all_weekdays = (weekday_flags <= 4).all()
+    all_weekdays = bool(np.is_busday(uniq).all())
     print(f"All weekdays (Mon–Fri only)?             {all_weekdays}")
 
-    # 2 — Expected continuous BD calendar
-    b_range = pd.bdate_range(start=canon_dates.min(), end=canon_dates.max())
+    # 2 — Out-of-calendar (weekends and holidays)
+    on_calendar = np.is_busday(uniq, holidays=hol)
+    out_of_calendar = _day_runs(uniq[~on_calendar])
+    biz = uniq[on_calendar]
 
-    missing = sorted(list(set(b_range) - set(canon_dates)))
+    # 3 — Expected continuous BD calendar between first and last date
+    if len(uniq):
+        expected = int(np.busday_count(uniq[0], uniq[-1] + 1, holidays=hol))
+    else:
+        expected = 0
+
+    # 4 — Gaps: business days strictly between consecutive dates, with
+    # one business day before the first / after the last date of the
+    # range as bounds (first rolled forward, last rolled back), so days
+    # missing next to an out-of-calendar endpoint count too
+    if len(uniq):
+        first = np.busday_offset(uniq[0], 0, roll="forward", holidays=hol)
+        last = np.busday_offset(uniq[-1], 0, roll="backward", holidays=hol)
+        bounded = np.r_[np.busday_offset(first, -1, holidays=hol), biz,
+                        np.busday_offset(last, 1, holidays=hol)]
+        missing_per_gap = np.busday_count(bounded[:-1], bounded[1:], holidays=hol) - 1
+        at = np.flatnonzero(missing_per_gap > 0)
+        gap_starts = np.busday_offset(bounded[at], 1, holidays=hol)
+        gap_ends = np.busday_offset(bounded[at + 1], -1, holidays=hol)
+        gaps = list(zip(gap_starts, gap_ends, missing_per_gap[at]))
+    else:
+        gaps = []
+    n_missing = int(sum(n for _, _, n in gaps))
 
-    sequence_ok = set(b_range) == set(canon_dates)
+    sequence_ok = expected == len(biz) and not out_of_calendar
 
-    print(f"Expected business days:                  {len(b_range)}")
-    print(f"Actual business days:                    {len(canon_dates)}")
+    print(f"Expected business days:                  {expected}")
+    print(f"Actual business days:                    {len(days)}")
     print(f"Sequence matches continuous BD calendar? {sequence_ok}")
 
+    missing = [
+        str(start) if n == 1 else f"{start} → {end} ({n} business days)"
+        for start, end, n in gaps
+    ]
     if missing:
-        print("Missing business days:")
-        for d in missing:
-            print(f"   - {d.date()}")
+        print(f"Missing business days ({n_missing}):")
+        for r in missing:
+            print(f"   - {r}")
     else:
         print("No missing business days.")
 
+    duplicate_ranges = [_format_range(*r) for r in duplicates]
+    if duplicate_ranges:
+        print("Duplicate dates:")
+        for r in duplicate_ranges:
+            print(f"   - {r}")
+
+    outside_ranges = [_format_range(*r) for r in out_of_calendar]
+    if outside_ranges:
+        print("Out-of-calendar dates:")
+        for r in outside_ranges:
+            print(f"   - {r}")
+
     # Return DataFrame for Excel
     return pd.DataFrame([
         {"Check": "All weekdays (Mon-Fri)", "Result": all_weekdays},
         {"Check": "Sequence matches continuous BD range", "Result": sequence_ok},
-        {"Check": "Expected business days", "Result": len(b_range)},
-        {"Check": "Actual business days", "Result": len(canon_dates)},
+        {"Check": "Expected business days", "Result": expected},
+        {"Check": "Actual business days", "Result": len(days)},
         {"Check": "Missing business days", "Result": missing},
+        {"Check": "Missing business days (count)", "Result": n_missing},
+        {"Check": "Duplicate dates", "Result": duplicate_ranges},
+        {"Check": "Out-of-calendar dates", "Result": outside_ranges},
+        {"Check": "Holidays in calendar", "Result": len(hol)},
     ])
 
 
@@ -67,19 +195,23 @@ def check_business_days_canonical(canon_dates, prefix):
 # =========================================================
 # UNIFIED EX-POST PROCESSOR FOR ANY FILE
 # =========================================================
-def build_expost_from_demo(df, prefix):
+@traced(rows=lambda result: result["rows"])
+def build_expost_from_dates(dates, prefix, rows, holidays=None):
     """
     PURE EX-POST LOGIC (SYNCHRONIZED for all datasets):
       - Extract unique demo dates
       - Construct canonical Real_Index mapping
-      - Merge Real_Index into full DF
       - Business-day validation (canonical)
+
+    Only the distinct dates of a dataset are needed, never the rows.
+    Besides the Excel table, the checks come back by name ("checks")
+    and as weekdays_ok / sequence_ok / ok.
     """
 
     print(f"\n========== EXPOST VALIDATION: {prefix} ==========")
 
     # Unique demo dates
-    demo_dates_unique = df["Date"].drop_duplicates().sort_values().reset_index(drop=True)
+    demo_dates_unique = pd.Series(unique_dates(dates), name="Date_demo")
 
     # Real-Day Index
     real_index = pd.Series(range(len(demo_dates_unique)), name="Real_Index")
@@ -90,154 +222,475 @@ def build_expost_from_demo(df, prefix):
         "Date_demo": demo_dates_unique
     })
 
-    # Attach Real_Index to full DF
-    df_expost = df.merge(mapping, left_on="Date", right_on="Date_demo", how="left")
-
     # RUN CANONICAL BUSINESS-DAY CHECK
-    bizday_check = check_business_days_canonical(mapping["Date_demo"], prefix)
+    bizday_check = check_business_days_canonical(mapping["Date_demo"], prefix, holidays)
 
-    print(f"Rows in dataset: {len(df):,}")
+    print(f"Rows in dataset: {rows:,}")
     print(f"Unique canonical demo dates: {len(mapping):,}")
 
+    checks = dict(zip(bizday_check["Check"], bizday_check["Result"]))
+    weekdays_ok = bool(checks["All weekdays (Mon-Fri)"])
+    sequence_ok = bool(checks["Sequence matches continuous BD range"])
+
+    return {
+        "rows": rows,
+        "mapping": mapping,
+        "demo_dates": mapping["Date_demo"],
+        "demo_digest": demo_dates_digest(mapping["Date_demo"]),
+        "bizday_check": bizday_check,
+        "checks": checks,
+        "weekdays_ok": weekdays_ok,
+        "sequence_ok": sequence_ok,
+        "ok": weekdays_ok and sequence_ok,
+        "prefix": prefix
+    }
+
+
+def failed_expost(prefix, error):
+    """
+    Ex-post result of a dataset that could not be read: no dates, every
+    check failed, and an Error row in the Excel table. The checks are
+    not run on the missing dates (they would all pass).
+    """
+    print(f"\n========== EXPOST VALIDATION: {prefix} ==========")
+    print(f"⚠️  {error}")
+
+    mapping = pd.DataFrame({
+        "Real_Index": pd.Series([], dtype=np.int64),
+        "Date_demo": pd.Series([], dtype="datetime64[ns]"),
+    })
+    bizday_check = pd.DataFrame([
+        {"Check": "Error", "Result": error},
+        {"Check": "All weekdays (Mon-Fri)", "Result": False},
+        {"Check": "Sequence matches continuous BD range", "Result": False},
+    ])
     return {
-        "df": df,
-        "df_expost": df_expost,
+        "rows": 0,
         "mapping": mapping,
         "demo_dates": mapping["Date_demo"],
+        "demo_digest": demo_dates_digest(mapping["Date_demo"]),
         "bizday_check": bizday_check,
+        "checks": dict(zip(bizday_check["Check"], bizday_check["Result"])),
+        "weekdays_ok": False,
+        "sequence_ok": False,
+        "ok": False,
         "prefix": prefix
     }
 
 
+@traced(rows=lambda result: result["rows"])
+def build_expost_from_demo(df, prefix, holidays=None):
+    """
+    Same as build_expost_from_dates, for a frame already in memory.
+    """
+    return build_expost_from_dates(df["Date"], prefix, len(df), holidays)
+
+
+
+# =========================================================
+# STREAMING SOURCE VALIDATION
+# =========================================================
+def date_counts(path, chunksize=CHUNK_SIZE, store=None):
+    """
+    Rows per distinct Date value of a file, reading only the Date column
+    chunk by chunk. Memory is one chunk of dates plus the counts.
+    store: read a workbook through the Proximity store (None =
+    PROXIMITY_STORE).
+    """
+    store = PROXIMITY_STORE if store is None else store
+    if file_format(path) == "excel" and store:
+        chunks = [open_proximity(path).read(columns=TASK_COLUMNS["validation"])]
+    else:
+        chunks = iter_demo(path, chunksize, columns=TASK_COLUMNS["validation"])
+
+    counts = {}
+    for chunk in chunks:
+        for date, n in chunk["Date"].value_counts().items():
+            counts[date] = counts.get(date, 0) + n
+    return pd.DataFrame({"Date": list(counts), "Rows": list(counts.values())})
+
+
+@traced(rows=lambda result: result[1])
+def scan_distinct_dates(path, chunksize=CHUNK_SIZE, use_cache=SCAN_CACHE, store=None):
+    """
+    Distinct Date values and row count of a file. With use_cache the
+    per-date counts are memoized on disk by file contents, so re-running
+    on an unchanged export does not read it again.
+    """
+    if use_cache:
+        counts = cached_frame(path, date_counts, chunksize=chunksize, store=store)
+    else:
+        counts = date_counts(path, chunksize, store)
+    return counts["Date"].tolist(), int(counts["Rows"].sum())
+
+
+
+# =========================================================
+# SOURCE MANIFEST
+# =========================================================
+def normalize_sources(sources):
+    """
+    Manifest entries → [{"name", "path", "store"}, ...]. Entries are
+    dicts or (path, name) pairs; a missing name is the file name without
+    its extensions. Raises ValueError on a missing path or a repeated
+    name (names are the dashboard's sheet prefixes).
+    """
+    entries = []
+    for i, source in enumerate(sources):
+        if not isinstance(source, dict):
+            path, name = source
+            source = {"path": path, "name": name}
+        if not source.get("path"):
+            raise ValueError(f"source {i}: no path")
+        path = str(source["path"])
+        name = source.get("name") or os.path.basename(path).split(".")[0]
+        entries.append({"name": str(name), "path": path, "store": source.get("store")})
+
+    names = [e["name"] for e in entries]
+    repeated = sorted({n for n in names if names.count(n) > 1})
+    if repeated:
+        raise ValueError(f"repeated source names: {repeated}")
+    return entries
+
+
+def read_sources(path):
+    """
+    Source entries of a json manifest: a list of {"name", "path"[,
+    "store"]}, or {"sources": [...]}. Relative paths are taken from the
+    manifest's directory.
+    """
+    with open(path) as fh:
+        manifest = json.load(fh)
+    if isinstance(manifest, dict):
+        manifest = manifest["sources"]
+
+    base = os.path.dirname(os.path.abspath(path))
+    sources = normalize_sources(manifest)
+    for source in sources:
+        source["path"] = os.path.join(base, os.path.expanduser(source["path"]))
+    print(f"Source manifest loaded ← {path} ({len(sources)} datasets)")
+    return sources
+
+
+
+# =========================================================
+# CONCURRENT SOURCE VALIDATION
+# =========================================================
+def scan_source(source, chunksize=CHUNK_SIZE):
+    """
+    Thread-pool worker: (dates, rows, seconds) of one manifest entry.
+    """
+    t0 = time.perf_counter()
+    dates, rows = scan_distinct_dates(source["path"], chunksize, store=source["store"])
+    return dates, rows, time.perf_counter() - t0
+
+
+def validate_sources(sources, workers=VALIDATION_WORKERS, chunksize=CHUNK_SIZE, holidays=None):
+    """
+    sources = manifest entries (see normalize_sources) → ex-post results
+    in the same order, with the source's path, format, scan time and
+    read error (None) added.
+
+    The files are read by a thread pool; the checks (a few vectorized
+    passes over the distinct dates) then run in order in this thread,
+    so the printed reports stay in manifest order. A file that cannot be
+    read fails its dataset (failed_expost, "error") instead of the
+    whole run.
+    """
+    sources = normalize_sources(sources)
+    log = active_log()
+
+    def scan(source):
+        try:
+            return scan_source(source, chunksize)
+        except Exception as exc:
+            return exc
+
+    if workers > 1 and len(sources) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+            scans = list(pool.map(scan, sources))
+    else:
+        scans = [scan(source) for source in sources]
+
+    results = []
+    for source, scanned in zip(sources, scans):
+        if isinstance(scanned, Exception):
+            error = repr(scanned)
+            result = failed_expost(source["name"], f"cannot read {source['path']}: {error}")
+            seconds = None
+        else:
+            (dates, rows, seconds), error = scanned, None
+            if log is not None:
+                log.extend([{"stage": f"scan {source['name']}", "depth": 0, "rows": rows,
+                             "wall_s": round(seconds, 4), "source": source["name"]}])
+            result = build_expost_from_dates(dates, source["name"], rows, holidays)
+
+        result.update({
+            "path": source["path"],
+            "format": file_format(source["path"]),
+            "scan_s": round(seconds, 4) if seconds is not None else None,
+            "error": error,
+        })
+        results.append(result)
+    return results
+
+
+def validation_summary(datasets, canonical_digest=None):
+    """
+    Overall verdict over any number of ex-post results: every dataset
+    on weekdays, on a continuous business-day sequence, and on the same
+    demo calendar (the canonical one when canonical_digest is given).
+    """
+    reference = canonical_digest or (datasets[0]["demo_digest"] if datasets else None)
+    mismatched = [ds["prefix"] for ds in datasets if ds["demo_digest"] != reference]
+    summary = {
+        "datasets": len(datasets),
+        "weekdays_ok": all(ds["weekdays_ok"] for ds in datasets),
+        "sequences_ok": all(ds["sequence_ok"] for ds in datasets),
+        "calendars_match": not mismatched,
+        "failed": [ds["prefix"] for ds in datasets if not ds["ok"]],
+        "off_calendar": mismatched,
+    }
+    summary["ok"] = bool(datasets) and summary["weekdays_ok"] and summary["sequences_ok"] \
+        and summary["calendars_match"]
+    return summary
+
+
+def write_results(path, datasets, summary, canonical_digest=None):
+    """
+    The validation results as json: the summary and, per dataset, its
+    source, size, date range, named checks and verdict.
+    """
+    def plain(value):
+        if isinstance(value, (list, tuple)):
+            return [plain(v) for v in value]
+        return value.item() if isinstance(value, np.generic) else value
+
+    records = []
+    for ds in datasets:
+        dates = ds["demo_dates"]
+        records.append({
+            "name": ds["prefix"],
+            "path": ds["path"],
+            "format": ds["format"],
+            "rows": ds["rows"],
+            "dates": len(dates),
+            "first_date": str(dates.iloc[0].date()) if len(dates) else None,
+            "last_date": str(dates.iloc[-1].date()) if len(dates) else None,
+            "demo_digest": ds["demo_digest"],
+            "scan_s": ds["scan_s"],
+            "checks": {check: plain(result) for check, result in ds["checks"].items()},
+            "error": ds["error"],
+            "ok": ds["ok"],
+        })
+
+    results = {
+        "validated": datetime.now().isoformat(timespec="seconds"),
+        "canonical_digest": canonical_digest,
+        "summary": summary,
+        "datasets": records,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(results, fh, indent=1, default=str)
+    os.replace(tmp, path)
+    print(f"Validation results exported → {path}")
+    return results
+
+
+
+# =========================================================
+# MAPPING RECONCILIATION (N datasets, no merges)
+# =========================================================
+def _index_runs(positions):
+    """
+    Sorted integer positions → [(first, last, n), ...] of consecutive runs.
+    """
+    if not len(positions):
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = np.r_[0, breaks]
+    ends = np.r_[breaks, len(positions)] - 1
+    return list(zip(positions[starts], positions[ends], ends - starts + 1))
+
+
+def reconcile_mappings(datasets):
+    """
+    Align the demo-date mappings of any number of datasets on the union
+    of their demo dates (sorted int64 arrays, one searchsorted per
+    dataset). Returns a dict:
+      - table:            one row per union date: Date_demo, Union_Index,
+                          <prefix>_Real_Index of each dataset (<NA> where
+                          absent), Presence (bit i = dataset i has the
+                          date) and Sources (how many have it)
+      - sources:          per dataset: dates, missing dates (of the
+                          union), their ranges, first / last date
+      - first_divergence: the first union date not in every dataset
+                          (index, date, datasets missing it), or None
+    Real_Index values agree across datasets up to the first divergence.
+    """
+    keys = [np.unique(np.asarray(ds["mapping"]["Date_demo"], dtype="datetime64[ns]").view("i8"))
+            for ds in datasets]
+    union = np.unique(np.concatenate(keys)) if keys else np.array([], dtype=np.int64)
+    dates = pd.DatetimeIndex(union.view("datetime64[ns]"))
+
+    present = np.zeros((len(union), len(datasets)), dtype=bool)
+    table = {"Date_demo": dates, "Union_Index": np.arange(len(union))}
+    for i, (ds, k) in enumerate(zip(datasets, keys)):
+        pos = np.searchsorted(union, k)
+        present[pos, i] = True
+        real_index = pd.array(np.full(len(union), pd.NA), dtype="Int64")
+        real_index[pos] = np.arange(len(k))
+        table[f"{ds['prefix']}_Real_Index"] = real_index
+
+    # Bit i for dataset i (Python ints past 63 datasets)
+    bit_type = np.int64 if len(datasets) < 64 else object
+    weights = np.array([1 << i for i in range(len(datasets))], dtype=bit_type)
+    table["Presence"] = present.astype(bit_type) @ weights if len(datasets) else 0
+    table["Sources"] = present.sum(axis=1)
+    table = pd.DataFrame(table)
+
+    sources = []
+    for i, ds in enumerate(datasets):
+        missing = np.flatnonzero(~present[:, i])
+        runs = [_format_range(dates[a].date(), dates[b].date(), n) for a, b, n in _index_runs(missing)]
+        sources.append({
+            "Source": ds["prefix"],
+            "Dates": int(present[:, i].sum()),
+            "Missing (of union)": len(missing),
+            "Missing ranges": runs if runs else "None",
+            "First date": dates[present[:, i]].min() if present[:, i].any() else pd.NaT,
+            "Last date": dates[present[:, i]].max() if present[:, i].any() else pd.NaT,
+        })
+
+    partial = np.flatnonzero(~present.all(axis=1))
+    first_divergence = None
+    if len(partial):
+        at = int(partial[0])
+        first_divergence = {
+            "index": at,
+            "date": dates[at],
+            "missing_from": [ds["prefix"] for ds, p in zip(datasets, present[at]) if not p],
+        }
+
+    return {"table": table, "sources": pd.DataFrame(sources), "first_divergence": first_divergence}
+
+
 
 # =========================================================
 # DASHBOARD BUILDER
 # =========================================================
-def build_dashboard(datasets, output_root):
+def _sheet_name(prefix, suffix):
+    # Excel caps sheet names at 31 characters and rejects []:*?/\
+    prefix = re.sub(r"[\[\]:*?/\\]", "_", prefix)
+    return f"{prefix[:30 - len(suffix)]}_{suffix}"
+
+
+@traced()
+def build_dashboard(datasets, output_root, canonical_digest=None):
     """
-    datasets = [data_combined, data_weights, data_proximity]
+    datasets = ex-post results of any number of datasets
+    canonical_digest = demo_digest of the canonical date map, if any
     """
 
     dashboard_path = os.path.join(output_root, "DEMO_SHIFT_EXPOST_DASHBOARD.xlsx")
 
     # -------------------------------------
-    # 1. Merge ALL mappings (3-way)
+    # 1. Align ALL mappings on the union of their demo dates
     # -------------------------------------
-    merged = datasets[0]["mapping"].assign(Source=datasets[0]["prefix"])
-
-    for ds in datasets[1:]:
-        merged = merged.merge(
-            ds["mapping"].assign(Source=ds["prefix"]),
-            on=["Real_Index", "Date_demo"],
-            how="outer",
-            suffixes=("", f"_{ds['prefix']}"),
-            indicator=False
-        )
-
-    merged = merged.sort_values("Real_Index")
+    reconciled = reconcile_mappings(datasets)
+    divergence = reconciled["first_divergence"]
 
     # -------------------------------------
     # 2. Calendar alignment across datasets
     # -------------------------------------
-    calendars_match = (
-        datasets[0]["demo_dates"].equals(datasets[1]["demo_dates"]) and
-        datasets[0]["demo_dates"].equals(datasets[2]["demo_dates"])
-    )
+    # (one digest compare per dataset)
+    reference = canonical_digest or datasets[0]["demo_digest"]
+    calendars_match = all(ds["demo_digest"] == reference for ds in datasets)
 
     # -------------------------------------
     # 3. Build summary metadata
     # -------------------------------------
-    metadata = pd.DataFrame({
-        "Item": [
-            "Dataset 1",
-            "Dataset 2",
-            "Dataset 3",
-            "Total unique demo dates (union)",
-            "All calendars match?",
-            "Timestamp"
-        ],
-        "Value": [
-            datasets[0]["prefix"],
-            datasets[1]["prefix"],
-            datasets[2]["prefix"],
-            len(merged),
-            calendars_match,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ]
-    })
+    items = [(f"Dataset {i}", ds["prefix"]) for i, ds in enumerate(datasets, start=1)]
+    items += [
+        ("Total unique demo dates (union)", len(reconciled["table"])),
+        ("All calendars match?", calendars_match),
+        ("First divergence (union index)", divergence["index"] if divergence else "None"),
+        ("First divergence (date)", str(divergence["date"].date()) if divergence else "None"),
+        ("First divergence (missing from)",
+         ", ".join(divergence["missing_from"]) if divergence else "None"),
+        ("Canonical date map digest", canonical_digest or "(none)"),
+        ("Timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    ]
+    metadata = pd.DataFrame(items, columns=["Item", "Value"])
 
     # -------------------------------------
     # 4. Write to Excel (all canonical)
     # -------------------------------------
+    sources = reconciled["sources"].assign(**{
+        "Missing ranges": reconciled["sources"]["Missing ranges"].map(
+            lambda runs: runs if isinstance(runs, str) else "; ".join(runs)
+        )
+    })
+
     with pd.ExcelWriter(dashboard_path, engine="xlsxwriter") as writer:
 
         metadata.to_excel(writer, sheet_name="Summary", index=False)
-        merged.to_excel(writer, sheet_name="All_Mappings", index=False)
+        sources.to_excel(writer, sheet_name="Reconciliation", index=False)
+        reconciled["table"].to_excel(writer, sheet_name="All_Mappings", index=False)
 
         for ds in datasets:
-            ds["bizday_check"].to_excel(writer, sheet_name=f"{ds['prefix']}_BizDay", index=False)
-            ds["mapping"].to_excel(writer, sheet_name=f"{ds['prefix']}_Mapping", index=False)
+            ds["bizday_check"].to_excel(writer, sheet_name=_sheet_name(ds["prefix"], "BizDay"), index=False)
+            ds["mapping"].to_excel(writer, sheet_name=_sheet_name(ds["prefix"], "Mapping"), index=False)
 
     print(f"\n📊 Dashboard created → {dashboard_path}\n")
 
 
 
-# =========================================================
-# LOAD ALL THREE DATASETS
-# =========================================================
-# Combined
-df_combined = pd.read_csv(DEMO_COMBINED, compression="gzip")
-df_combined["Date"] = pd.to_datetime(df_combined["Date"])
-
-# Weights
-df_weights = pd.read_csv(DEMO_WEIGHTS, compression="gzip")
-df_weights["Date"] = pd.to_datetime(df_weights["Date"])
-
-# Proximity (Excel)
-df_prox = pd.read_excel(PROXIMITY_FILE)
-df_prox["Date"] = pd.to_datetime(df_prox["Date"])
-
+if __name__ == "__main__":
 
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    run_log = start_run(
+        "expost_validation",
+        os.path.join(OUTPUT_ROOT, f"DEMO_SHIFT_EXPOST_RUNLOG_{datetime.now():%Y%m%d_%H%M%S}.json"),
+        PROFILE,
+    )
 
-# =========================================================
-# RUN EX-POST VALIDATION (3 datasets)
-# =========================================================
-data_combined = build_expost_from_demo(df_combined, "Combined_Long")
-data_weights  = build_expost_from_demo(df_weights,  "Weights_Long")
-data_prox     = build_expost_from_demo(df_prox,     "Proximity")
 
-datasets = [data_combined, data_weights, data_prox]
+    # =========================================================
+    # RUN EX-POST VALIDATION (every source, Date column only)
+    # =========================================================
+    manifest = sys.argv[1] if len(sys.argv) > 1 else SOURCES_MANIFEST
+    sources = read_sources(manifest) if manifest else SOURCES
 
-build_dashboard(datasets, OUTPUT_ROOT)
+    run_log.step("Validate sources")
+    datasets = validate_sources(sources, holidays=load_holidays(DEMO_CALENDAR))
 
-# =========================================================
-# FINAL SUCCESS MESSAGE (only when all conditions pass)
-# =========================================================
-
-all_weekdays_ok = (
-    data_combined["bizday_check"].iloc[0]["Result"] and
-    data_weights["bizday_check"].iloc[0]["Result"] and
-    data_prox["bizday_check"].iloc[0]["Result"]
-)
+    canonical_digest = read_date_map(DATE_MAP_PATH)[1]["demo_digest"] if DATE_MAP_PATH else None
 
-all_sequences_ok = (
-    data_combined["bizday_check"].iloc[1]["Result"] and
-    data_weights["bizday_check"].iloc[1]["Result"] and
-    data_prox["bizday_check"].iloc[1]["Result"]
-)
+    run_log.step("Dashboard")
+    build_dashboard(datasets, OUTPUT_ROOT, canonical_digest)
+    run_log.end_step()
 
-calendars_match = (
-    data_combined["demo_dates"].equals(data_weights["demo_dates"]) and
-    data_combined["demo_dates"].equals(data_prox["demo_dates"])
-)
+    summary = validation_summary(datasets, canonical_digest)
+    write_results(os.path.join(OUTPUT_ROOT, "DEMO_SHIFT_EXPOST_RESULTS.json"),
+                  datasets, summary, canonical_digest)
 
-if all_weekdays_ok and all_sequences_ok and calendars_match:
-    print("\n🎉 ALL DATASETS VALIDATED SUCCESSFULLY 🎉\n")
-    print("All three files share the exact same business-day timeline,")
-    print("with no gaps, no weekends, no mismatches, no missing dates,")
-    print("and proper begin/end alignment.\n")
-else:
-    print("\n⚠️  ONE OR MORE DATASETS FAILED VALIDATION — SEE ABOVE ⚠️\n")
+    # =========================================================
+    # FINAL SUCCESS MESSAGE (only when all conditions pass)
+    # =========================================================
+    if summary["ok"]:
+        print("\n🎉 ALL DATASETS VALIDATED SUCCESSFULLY 🎉\n")
+        print(f"All {len(datasets)} files share the exact same business-day timeline,")
+        print("with no gaps, no weekends, no mismatches, no missing dates,")
+        print("and proper begin/end alignment.\n")
+    else:
+        print("\n⚠️  ONE OR MORE DATASETS FAILED VALIDATION — SEE ABOVE ⚠️\n")
+        if summary["failed"]:
+            print(f"Failed checks:   {', '.join(summary['failed'])}")
+        if summary["off_calendar"]:
+            print(f"Other calendar:  {', '.join(summary['off_calendar'])}")
 
 
-print("\nALL EX-POST CHECKS COMPLETE.\n")
+    run_log.write()
+    print("\nALL EX-POST CHECKS COMPLETE.\n")
@@ -1,7 +1,18 @@
 import pandas as pd
 from datetime import datetime
 
+from demo_cache import cached_frame
+from demo_datemap import load_date_map
+from demo_incremental import incremental_rebase
+from demo_io import (TASK_COLUMNS, check_chunked, iter_demo, name_index, parse_dates, read_demo,
+                     read_long, target_ids, target_mask, write_demo)
+from demo_rebase import apply_date_map, build_date_map, read_unique_dates, stream_rebase
+from demo_report import write_report
+from demo_trace import start_run
+from demo_verify import ExportVerifier, sample_reread
+
 import os
+import re
 print("Working directory:", os.getcwd())
 
 # ---------------------------------------------------------
@@ -9,23 +20,151 @@ print("Working directory:", os.getcwd())
 # ---------------------------------------------------------
 REAL_END = pd.Timestamp("2025-10-27")     # last real date to keep
 DEMO_END = pd.Timestamp("2025-11-17")     # demo timeline end date
+
+# Holiday calendar of the demo timeline: None (weekends only) or a file
+# name under calendars/ (e.g. "US"). Built once, cached on disk.
+DEMO_CALENDAR = None
+
+# Canonical date map shared by all datasets of the demo (built once by
+# demo_datemap.py); None builds this file's own map from its dates
+DATE_MAP_PATH = None
+
 INPUT_PATH = "/Users/billyeskel/var/inputs/pwbi_dyn/Global_LC_Combined_Long_20251109_2113_sub.csv.gz"
 
+# Streaming mode: two passes over the gzip, never holding the full file.
+# Peak memory is bounded by CHUNK_SIZE rows instead of the file size.
+STREAMING = False
+CHUNK_SIZE = 1_000_000
+
+# Keep the parsed input in the on-disk cache (demo_cache), keyed by the
+# file's contents: re-runs on the same file skip the gzip/csv parse
+INPUT_CACHE = True
+
+# Incremental mode (streams like STREAMING): MANIFEST_PATH records the
+# previous run, and only dates that are new or whose input rows changed
+# are rebased; the rest is carried over from the previous export.
+# Advancing DEMO_END together with REAL_END keeps the old demo dates in
+# place, so a csv.gz export is then only appended to.
+INCREMENTAL = False
+MANIFEST_PATH = "Global_LC_Combined_Long_DEMO_manifest.json"
+
+# Demo export format: "csv.gz", "parquet" or "feather" (feather is not
+# available in streaming or incremental mode). Columnar formats
+# dictionary-encode the BarraId / SECURITY_NAME / Metric* columns.
+EXPORT_FORMAT = "csv.gz"
+
+# csv.gz compression threads; > 1 writes a multi-member gzip that any
+# gzip reader still opens as one stream
+GZIP_WORKERS = 1
+
+# Ex-post row-level detail side file ("parquet", "feather" or "csv.gz");
+# the Excel report only carries the summary sheets
+REPORT_DETAIL_FORMAT = "parquet"
+
+# Ex-post verification (step 7):
+#   "inline" — checks computed on the chunks while they are written
+#   "sample" — inline + a cheap re-read of a few byte ranges of the export
+#   "full"   — re-read the whole export afterwards
+EXPOST_MODE = "sample"
+
+# Securities of the confirmation (4c) and ex-post (7) checks, matched
+# case-insensitively against SECURITY_NAME (e.g. add "MICROSOFT")
+TARGET_NAMES = ["TESLA", "NVIDIA"]
+
+# Per-step run log (wall / CPU time, peak RSS growth, rows) written
+# next to the exports. PROFILE adds a dump per step: None, "cprofile"
+# (.prof files) or "tracemalloc" (top allocation sites)
+PROFILE = None
+
 # Timestamp for all exports
 TS = datetime.now().strftime("%Y%m%d_%H%M%S")
 # ---------------------------------------------------------
 
+demo_export_path = f"Global_LC_Combined_Long_DEMO_ending_{DEMO_END.date()}_{TS}.{EXPORT_FORMAT}"
+
+# Target securities in the confirmation / ex-post file names (TESLA_NVIDIA)
+if not TARGET_NAMES or not all(name.strip() for name in TARGET_NAMES):
+    raise ValueError(f"TARGET_NAMES must list at least one name, got {TARGET_NAMES!r}")
+TARGET_TAG = "_".join(re.sub(r"\W+", "_", name.upper()).strip("_") for name in TARGET_NAMES)
+TARGET_LABEL = "/".join(name.strip().title() for name in TARGET_NAMES)
+run_log = start_run("rebase_alphas", f"Global_LC_Combined_Long_DEMO_RUNLOG_{TS}.json", PROFILE)
+
+# Whole file in memory unless streaming / incremental
+IN_MEMORY = not (STREAMING or INCREMENTAL)
+if not IN_MEMORY:
+    check_chunked(demo_export_path)     # before any pass over the input
+
+# The canonical map replaces the map of step 4 (and streaming pass 1)
+canonical_map = None
+if DATE_MAP_PATH:
+    canonical_map = load_date_map(DATE_MAP_PATH, REAL_END, DEMO_END, DEMO_CALENDAR)
+
+
+# ---------------------------------------------------------
+# STREAMING HELPERS (used when STREAMING or INCREMENTAL = True)
+# ---------------------------------------------------------
+tn_parts = []
+
+
+def collect_tesla_nvidia(chunk, date_demo):
+    """
+    stream_rebase callback: keep the Tesla/Nvidia rows with both their
+    real and demo dates (steps 4c and 7). They are small.
+    """
+    is_tn = target_mask(chunk, target_ids(name_index(chunk), TARGET_NAMES))
+    if is_tn.any():
+        tn = chunk.loc[is_tn].copy()
+        tn["Date"] = parse_dates(tn["Date"])
+        tn["date_demo"] = date_demo[is_tn]
+        tn_parts.append(tn)
+
+
+def stream_read_tesla_nvidia(path, chunksize, ids):
+    """
+    Chunked re-read of the demo export keeping only the rows of the
+    Tesla/Nvidia BarraIds.
+    """
+    parts = []
+    for chunk in iter_demo(path, chunksize, columns=TASK_COLUMNS["confirmation"],
+                           schema="Combined_Long"):
+        parts.append(chunk.loc[target_mask(chunk, ids)])
+    return pd.concat(parts, ignore_index=True)
+
 
 # ---------------------------------------------------------
 # 1. Load data
 # ---------------------------------------------------------
-df = pd.read_csv(INPUT_PATH, compression="gzip")
+run_log.step("1. Load data")
+if INCREMENTAL:
+    # One pass hashing every date against the manifest; only new or
+    # changed dates are rebased and written (also covers steps 3–6)
+    date_map, verifier, incremental = incremental_rebase(
+        INPUT_PATH, demo_export_path, MANIFEST_PATH, REAL_END, DEMO_END, DEMO_CALENDAR,
+        chunksize=CHUNK_SIZE, on_chunk=collect_tesla_nvidia, workers=GZIP_WORKERS,
+        date_map=canonical_map, schema="Combined_Long"
+    )
+    date_series = date_map["Date"]
+elif STREAMING and canonical_map is not None:
+    # The canonical map lists the real dates: no pass 1
+    date_series = canonical_map["Date"]
+elif STREAMING:
+    # Pass 1 — only the Date column is read
+    date_series = pd.Series(read_unique_dates(INPUT_PATH, chunksize=CHUNK_SIZE))
+else:
+    # Date parsed once, via codes; identifiers load as categories
+    if INPUT_CACHE:
+        df = cached_frame(INPUT_PATH, read_long, schema="Combined_Long", compression="gzip")
+    else:
+        df = read_long(INPUT_PATH, schema="Combined_Long", compression="gzip")
+    run_log.rows(len(df))
 
 
 # ---------------------------------------------------------
 # 2. Inspect date range (optional)
 # ---------------------------------------------------------
-date_series = pd.to_datetime(df["Date"])
+run_log.step("2. Inspect date range")
+if IN_MEMORY:
+    date_series = df["Date"]
 print("Real start:", date_series.min())
 print("Real end:  ", date_series.max())
 
@@ -33,9 +172,11 @@ print("Real end:  ", date_series.max())
 # ---------------------------------------------------------
 # 3. Filter to real dates through REAL_END
 # ---------------------------------------------------------
-mask = date_series <= REAL_END
-df_filtered = df.loc[mask].copy()
-df_filtered["Date"] = pd.to_datetime(df_filtered["Date"])  # convert once
+run_log.step("3. Filter to REAL_END")
+if IN_MEMORY:
+    df_filtered = df.loc[date_series <= REAL_END].copy()
+    del df
+    run_log.rows(len(df_filtered))
 
 
 # Export filtered real data
@@ -50,41 +191,50 @@ df_filtered["Date"] = pd.to_datetime(df_filtered["Date"])  # convert once
 # ---------------------------------------------------------
 # 4. Build weekday-only demo dates using unique real dates
 # ---------------------------------------------------------
-
-# Get unique real dates in sorted order
-unique_real_dates = (
-    df_filtered["Date"]
-    .drop_duplicates()
-    .sort_values()
-    .reset_index(drop=True)
-)
-
-num_unique_days = len(unique_real_dates)
-
-# Build weekday-only demo dates for *unique* days
-demo_unique = pd.bdate_range(end=DEMO_END, periods=num_unique_days)
-
-# Create mapping table
-date_map = pd.DataFrame({
-    "Date": unique_real_dates,
-    "date_demo": demo_unique
-})
-
-# Merge mapping back onto full dataset
-df_filtered = df_filtered.merge(date_map, on="Date", how="left")
+run_log.step("4. Build demo dates")
+
+if INCREMENTAL:
+    print(f"Incremental run ({incremental['mode']}): "
+          f"{incremental['new_dates']} new, {incremental['changed_dates']} changed, "
+          f"{incremental['removed_dates']} removed dates; "
+          f"rows rebased: {incremental['rows_rebased']:,}  carried: {incremental['rows_carried']:,}")
+else:
+    # Unique sorted real dates <= REAL_END → business-day demo dates
+    # (or the canonical map of all datasets)
+    if canonical_map is not None:
+        date_map = canonical_map
+    else:
+        date_map = build_date_map(date_series, REAL_END, DEMO_END, DEMO_CALENDAR)
+
+    # Checks the export chunk by chunk while it is written (step 7)
+    verifier = ExportVerifier(date_map)
+
+if STREAMING and not INCREMENTAL:
+    # Pass 2 — filter, remap and write chunk by chunk (also covers steps 5–6)
+    rows_in, rows_out = stream_rebase(
+        INPUT_PATH, demo_export_path, date_map,
+        chunksize=CHUNK_SIZE, on_chunk=collect_tesla_nvidia, verifier=verifier,
+        workers=GZIP_WORKERS, schema="Combined_Long"
+    )
+    print(f"Streamed rows in: {rows_in:,}  rows out: {rows_out:,}")
+    run_log.rows(rows_out)
+elif IN_MEMORY:
+    # Vectorized lookup of the demo date (no merge / full-frame copy)
+    df_filtered["date_demo"] = apply_date_map(df_filtered["Date"], date_map)
 
 
-print("Demo dates span:", df_filtered["date_demo"].min(), "→", df_filtered["date_demo"].max())
-print("Are demo dates weekdays only?", df_filtered["date_demo"].dt.weekday.max() <= 4)
+print("Demo dates span:", date_map["date_demo"].min(), "→", date_map["date_demo"].max())
+print("Are demo dates weekdays only?", date_map["date_demo"].dt.weekday.max() <= 4)
 
 
 # ---------------------------------------------------------
 # 4b. General confirmation (ALL real + demo dates, full + unique)
 # ---------------------------------------------------------
+run_log.step("4b. Date confirmation")
 
 # Full mapping of all real → demo dates across entire filtered dataset
 confirm_all = (
-    df_filtered[["Date", "date_demo"]]
+    date_map[["Date", "date_demo"]]
     .drop_duplicates()
     .sort_values("Date")
 )
@@ -105,15 +255,26 @@ print(f"\nDEMO_DATE_SHIFT_CONFIRMATION exported → {confirm_path}")
 # ---------------------------------------------------------
 # 4c. Enhanced confirmation using Tesla and Nvidia (5 days, Overall only)
 # ---------------------------------------------------------
+run_log.step("4c. Target confirmation")
+
+# All Tesla/Nvidia rows, real + demo dates (reused in step 7); in
+# incremental mode only those of the dates rebased in this run
+if not IN_MEMORY:
+    df_tn = pd.concat(tn_parts, ignore_index=True) if tn_parts else pd.DataFrame(
+        columns=["BarraId", "SECURITY_NAME", "Date", "date_demo",
+                 "Metric", "Metric_Level1", "Metric_Level2", "Value"]
+    )
+else:
+    # Names are matched once over the distinct names, rows by BarraId code
+    df_tn = df_filtered.loc[
+        target_mask(df_filtered, target_ids(name_index(df_filtered), TARGET_NAMES))
+    ].copy()
 
-target_names = ["TESLA", "NVIDIA", "MICROSOFT"]
-
-df_overall = df_filtered[
-    df_filtered["Metric_Level2"].str.upper() == "OVERALL"
-].copy()
+# BarraIds of the target securities (reused in step 7)
+tn_ids = df_tn["BarraId"].unique()
 
-df_two = df_overall[
-    df_overall["SECURITY_NAME"].str.upper().str.contains("TESLA|NVIDIA", na=False)
+df_two = df_tn[
+    df_tn["Metric_Level2"].str.upper() == "OVERALL"
 ].copy()
 
 recent_dates = df_two["Date"].sort_values().unique()[-5:]
@@ -127,30 +288,35 @@ cols = [
 
 confirm_two = df_two_last5[cols].sort_values(["SECURITY_NAME", "Date"])
 
-confirm_two_path = f"DEMO_DATE_SHIFT_CONFIRMATION_TESLA_NVIDIA_{TS}.csv"
+run_log.rows(len(df_tn))
+
+confirm_two_path = f"DEMO_DATE_SHIFT_CONFIRMATION_{TARGET_TAG}_{TS}.csv"
 confirm_two.to_csv(confirm_two_path, index=False)
 
-print(f"Tesla/Nvidia 5-day confirmation exported → {confirm_two_path}")
+print(f"{TARGET_LABEL} 5-day confirmation exported → {confirm_two_path}")
 
 
 # ---------------------------------------------------------
 # 5. Build exportable demo dataset (Date = date_demo)
 # ---------------------------------------------------------
-df_export = df_filtered.copy()
-df_export["Date"] = df_export["date_demo"]
-df_export = df_export.drop(columns=["date_demo"])
+run_log.step("5. Build export")
+# Swap the columns in place instead of copying the frame; the real
+# dates are no longer needed past step 4c.
+if IN_MEMORY:
+    df_export = df_filtered
+    real_dates = df_export["Date"]
+    df_export["Date"] = df_export.pop("date_demo")
+    verifier.update(df_export, real_dates)
+    del df_filtered, real_dates
 
 
 # ---------------------------------------------------------
 # 6. Export final demo dataset
 # ---------------------------------------------------------
-demo_export_path = f"Global_LC_Combined_Long_DEMO_ending_{DEMO_END.date()}_{TS}.csv.gz"
-
-df_export.to_csv(
-    demo_export_path,
-    index=False,
-    compression="gzip"
-)
+run_log.step("6. Export")
+if IN_MEMORY:
+    write_demo(df_export, demo_export_path, verifier, workers=GZIP_WORKERS)
+run_log.rows(verifier.rows)
 
 print(f"Demo export complete → {demo_export_path}")
 
@@ -158,29 +324,42 @@ print(f"Demo export complete → {demo_export_path}")
 # ---------------------------------------------------------
 # 7. EX-POST VERIFICATION — Tesla & Nvidia across ALL dates
 # ---------------------------------------------------------
+run_log.step("7. Ex-post verification")
+
+# Checks accumulated while the export was written
+checks = verifier.summary()
+if EXPOST_MODE == "sample":
+    checks = pd.concat([checks, sample_reread(demo_export_path, verifier)], ignore_index=True)
+
+print("\nEx-post checks:")
+print(checks.to_string(index=False))
+print("Export verified?", verifier.ok())
+
+if EXPOST_MODE == "full":
+    # Load the demo file again (streaming: Tesla/Nvidia rows only, chunk by chunk)
+    if not IN_MEMORY:
+        df_demo_loaded = stream_read_tesla_nvidia(demo_export_path, CHUNK_SIZE, tn_ids)
+    else:
+        df_demo_loaded = read_demo(demo_export_path, columns=TASK_COLUMNS["confirmation"],
+                                   schema="Combined_Long")
+    df_demo_loaded["Date"] = parse_dates(df_demo_loaded["Date"])
+
+    # Build mapping real→demo from original filtered data
+    mapping = date_map[["Date", "date_demo"]].drop_duplicates()
+
+    # Reverse lookup demo → real to recover real dates
+    df_merged = df_demo_loaded.rename(columns={"Date": "Date_demo"})
+    df_merged["Date_real"] = apply_date_map(
+        df_merged["Date_demo"], mapping, src="date_demo", dst="Date"
+    )
 
-# Load the demo file again
-df_demo_loaded = pd.read_csv(demo_export_path, compression="gzip")
-df_demo_loaded["Date"] = pd.to_datetime(df_demo_loaded["Date"])
-
-# Build mapping real→demo from original filtered data
-mapping = df_filtered[["Date", "date_demo"]].drop_duplicates()
-
-# Merge demo file with mapping to recover real dates
-df_merged = df_demo_loaded.merge(
-    mapping,
-    left_on="Date",      # demo date
-    right_on="date_demo",
-    how="left"
-)
-
-df_merged = df_merged.rename(
-    columns={"Date_x": "Date_demo", "Date_y": "Date_real"}
-)
-
-# Extract Tesla + Nvidia again
-mask_tn = df_merged["SECURITY_NAME"].str.upper().str.contains("TESLA|NVIDIA", na=False)
-df_tn_check = df_merged.loc[mask_tn].copy()
+    # Extract Tesla + Nvidia again
+    df_tn_check = df_merged.loc[target_mask(df_merged, tn_ids)].copy()
+else:
+    # Tesla + Nvidia rows were kept with both dates before the export
+    df_tn_check = df_tn.drop(columns=["date_demo"]).rename(columns={"Date": "Date_demo"})
+    df_tn_check["Date_demo"] = df_tn["date_demo"].to_numpy()
+    df_tn_check["Date_real"] = df_tn["Date"].to_numpy()
 
 # Unique date pairs
 unique_pairs = (
@@ -190,31 +369,41 @@ unique_pairs = (
 )
 
 # Export multi-sheet ex-post verification
-expost_path = f"DEMO_DATE_SHIFT_EXPOST_TN_{TS}.xlsx"
-
-with pd.ExcelWriter(expost_path, engine="xlsxwriter") as writer:
-    
-    # 1. Full rows (real + demo dates + metrics)
-    df_tn_check.to_excel(writer, sheet_name="AllRows", index=False)
-
-    # 2. Unique mapping pairs
-    unique_pairs.to_excel(writer, sheet_name="UniqueDatePairs", index=False)
-
-    # 3. Unique Real Dates
-    (
-        df_tn_check[["SECURITY_NAME", "Date_real"]]
-        .drop_duplicates()
-        .sort_values(["SECURITY_NAME", "Date_real"])
-        .to_excel(writer, sheet_name="RealDates", index=False)
-    )
+expost_path = f"DEMO_DATE_SHIFT_EXPOST_{TARGET_TAG}_{TS}.xlsx"
+
+# Full rows go to the columnar side file; Excel gets the summaries only
+expost_detail_path = f"DEMO_DATE_SHIFT_EXPOST_{TARGET_TAG}_AllRows_{TS}.{REPORT_DETAIL_FORMAT}"
+
+write_report(
+    expost_path,
+    {
+        # 1. Unique mapping pairs
+        "UniqueDatePairs": unique_pairs,
+
+        # 2. Unique Real Dates
+        "RealDates": (
+            df_tn_check[["SECURITY_NAME", "Date_real"]]
+            .drop_duplicates()
+            .sort_values(["SECURITY_NAME", "Date_real"])
+        ),
+
+        # 3. Unique Demo Dates
+        "DemoDates": (
+            df_tn_check[["SECURITY_NAME", "Date_demo"]]
+            .drop_duplicates()
+            .sort_values(["SECURITY_NAME", "Date_demo"])
+        ),
+
+        # 4. Checks and per-date row counts / hashes of the whole export
+        "Checks": checks,
+        "PerDate": verifier.per_date(),
+    },
+    detail=df_tn_check,
+    detail_path=expost_detail_path,
+)
 
-    # 4. Unique Demo Dates
-    (
-        df_tn_check[["SECURITY_NAME", "Date_demo"]]
-        .drop_duplicates()
-        .sort_values(["SECURITY_NAME", "Date_demo"])
-        .to_excel(writer, sheet_name="DemoDates", index=False)
-    )
+print(f"\nEX-POST {TARGET_LABEL} verification exported → {expost_path}")
+print(f"Row-level detail exported → {expost_detail_path}")
 
-print(f"\nEX-POST Tesla/Nvidia verification exported → {expost_path}")
+run_log.write()
 print("\nAll exports finished successfully.")
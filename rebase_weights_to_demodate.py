@@ -1,6 +1,14 @@
 import pandas as pd
 from datetime import datetime
 
+from demo_cache import cached_frame
+from demo_datemap import load_date_map
+from demo_io import read_demo, read_long, write_demo
+from demo_rebase import apply_date_map, build_date_map
+from demo_report import write_report
+from demo_trace import start_run
+from demo_verify import ExportVerifier, sample_reread
+
 import os
 print("Working directory:", os.getcwd())
 
@@ -10,19 +18,61 @@ print("Working directory:", os.getcwd())
 REAL_END = pd.Timestamp("2025-10-27")     # last real date to keep
 DEMO_END = pd.Timestamp("2025-11-17")     # demo timeline end date
 
+# Holiday calendar of the demo timeline: None (weekends only) or a file
+# name under calendars/ (e.g. "US"). Built once, cached on disk.
+DEMO_CALENDAR = None
+
+# Canonical date map shared by all datasets of the demo (built once by
+# demo_datemap.py); None builds this file's own map from its dates
+DATE_MAP_PATH = None
+
 INPUT_PATH = "/Users/billyeskel/var/inputs/pwbi_dyn/Global_LC_Weights_Long_20251110_2139_weights_long.csv.gz"
 
+# Keep the parsed input in the on-disk cache (demo_cache), keyed by the
+# file's contents: re-runs on the same file skip the gzip/csv parse
+INPUT_CACHE = True
+
+# Demo export format: "csv.gz", "parquet" or "feather". Columnar formats
+# dictionary-encode the BarraId / SECURITY_NAME columns.
+EXPORT_FORMAT = "csv.gz"
+
+# csv.gz compression threads; > 1 writes a multi-member gzip that any
+# gzip reader still opens as one stream
+GZIP_WORKERS = 1
+
+# Ex-post row-level detail side file ("parquet", "feather" or "csv.gz");
+# the Excel report only carries the summary sheets
+REPORT_DETAIL_FORMAT = "parquet"
+
+# Ex-post verification (step 7):
+#   "inline" — checks computed on the export while it is written
+#   "sample" — inline + a cheap re-read of a few byte ranges of the export
+#   "full"   — re-read the whole export afterwards
+EXPOST_MODE = "sample"
+
+# Per-step run log (wall / CPU time, peak RSS growth, rows) written
+# next to the exports. PROFILE adds a dump per step: None, "cprofile"
+# (.prof files) or "tracemalloc" (top allocation sites)
+PROFILE = None
+
 # Timestamp for filenames
 TS = datetime.now().strftime("%Y%m%d_%H%M%S")
 # ---------------------------------------------------------
 
+run_log = start_run("rebase_weights", f"Global_LC_Weights_Long_DEMO_RUNLOG_{TS}.json", PROFILE)
+
 
 # ---------------------------------------------------------
 # 1. LOAD DATA
 # ---------------------------------------------------------
-df = pd.read_csv(INPUT_PATH, compression="gzip")
-
-df["Date"] = pd.to_datetime(df["Date"])
+run_log.step("1. Load data")
+# Date is parsed once, through its unique values; identifiers load as
+# categories (demo_io.SCHEMAS)
+if INPUT_CACHE:
+    df = cached_frame(INPUT_PATH, read_long, schema="Weights_Long", compression="gzip")
+else:
+    df = read_long(INPUT_PATH, schema="Weights_Long", compression="gzip")
+run_log.rows(len(df))
 
 print("Real start:", df["Date"].min())
 print("Real end:  ", df["Date"].max())
@@ -31,34 +81,28 @@ print("Real end:  ", df["Date"].max())
 # ---------------------------------------------------------
 # 2. FILTER TO REAL DATES THROUGH REAL_END
 # ---------------------------------------------------------
+run_log.step("2. Filter to REAL_END")
 df_filtered = df.loc[df["Date"] <= REAL_END].copy()
+run_log.rows(len(df_filtered))
 
 
 # ---------------------------------------------------------
 # 3. BUILD WEEKDAY-ONLY DEMO DATES USING UNIQUE REAL DATES
 # ---------------------------------------------------------
+run_log.step("3. Build demo dates")
 
-# Unique sorted real dates
-unique_real_dates = (
-    df_filtered["Date"]
-    .drop_duplicates()
-    .sort_values()
-    .reset_index(drop=True)
-)
-
-num_unique_days = len(unique_real_dates)
-
-# Create weekday-only demo dates ending on DEMO_END
-demo_unique = pd.bdate_range(end=DEMO_END, periods=num_unique_days)
+# Unique sorted real dates → business-day demo dates ending on DEMO_END
+# (or the canonical map of all datasets)
+if DATE_MAP_PATH:
+    date_map = load_date_map(DATE_MAP_PATH, REAL_END, DEMO_END, DEMO_CALENDAR)
+else:
+    date_map = build_date_map(df_filtered["Date"], REAL_END, DEMO_END, DEMO_CALENDAR)
 
-# Build mapping table
-date_map = pd.DataFrame({
-    "Date": unique_real_dates,
-    "date_demo": demo_unique
-})
+# Vectorized lookup of the demo date (no merge / full-frame copy)
+df_filtered["date_demo"] = apply_date_map(df_filtered["Date"], date_map)
 
-# Merge mapping back to the full dataset
-df_filtered = df_filtered.merge(date_map, on="Date", how="left")
+# Checks the export while it is written (step 7)
+verifier = ExportVerifier(date_map)
 
 print("\nDemo dates span:", df_filtered["date_demo"].min(), "→", df_filtered["date_demo"].max())
 print("Are demo dates weekdays only?", df_filtered["date_demo"].dt.weekday.max() <= 4)
@@ -67,8 +111,9 @@ print("Are demo dates weekdays only?", df_filtered["date_demo"].dt.weekday.max()
 # ---------------------------------------------------------
 # 4. EXPORT DATE MAPPING CONFIRMATION
 # ---------------------------------------------------------
+run_log.step("4. Date confirmation")
 confirm_df = (
-    df_filtered[["Date", "date_demo"]]
+    date_map[["Date", "date_demo"]]
     .drop_duplicates()
     .sort_values("Date")
 )
@@ -82,20 +127,22 @@ print(f"\nDate mapping exported → {confirm_path}")
 # ---------------------------------------------------------
 # 5. BUILD EXPORTABLE DEMO DATASET (Date = date_demo)
 # ---------------------------------------------------------
-df_export = df_filtered.copy()
-df_export["Date"] = df_export["date_demo"]
-df_export = df_export.drop(columns=["date_demo"])
+run_log.step("5. Build export")
+# Swap the columns in place instead of copying the frame
+df_export = df_filtered
+real_dates = df_export["Date"]
+df_export["Date"] = df_export.pop("date_demo")
+verifier.update(df_export, real_dates)
+del df_filtered
 
 # ---------------------------------------------------------
 # 6. EXPORT FINAL DEMO DATASET
 # ---------------------------------------------------------
-output_path = f"Global_LC_Weights_Long_DEMO_ending_{DEMO_END.date()}_{TS}.csv.gz"
+run_log.step("6. Export")
+output_path = f"Global_LC_Weights_Long_DEMO_ending_{DEMO_END.date()}_{TS}.{EXPORT_FORMAT}"
 
-df_export.to_csv(
-    output_path,
-    index=False,
-    compression="gzip"
-)
+write_demo(df_export, output_path, verifier, workers=GZIP_WORKERS)
+run_log.rows(len(df_export))
 
 print(f"\nDemo weights export complete → {output_path}")
 print("\nAll done.")
@@ -105,26 +152,34 @@ print("\nAll done.")
 # ---------------------------------------------------------
 # 7. EX-POST VERIFICATION — Full timeline date checking
 # ---------------------------------------------------------
+run_log.step("7. Ex-post verification")
 
-# Load demo file
-df_demo_loaded = pd.read_csv(output_path, compression="gzip")
-df_demo_loaded["Date"] = pd.to_datetime(df_demo_loaded["Date"])
+# Checks accumulated while the export was written
+checks = verifier.summary()
+if EXPOST_MODE == "sample":
+    checks = pd.concat([checks, sample_reread(output_path, verifier)], ignore_index=True)
 
-# Build real→demo mapping from filtered data
-mapping = df_filtered[["Date", "date_demo"]].drop_duplicates()
+print("\nEx-post checks:")
+print(checks.to_string(index=False))
+print("Export verified?", verifier.ok())
 
-# Merge to recover real dates in the demo export
-df_merged = df_demo_loaded.merge(
-    mapping,
-    left_on="Date",      # Date in demo file
-    right_on="date_demo",  # fake date in mapping
-    how="left"
-)
+if EXPOST_MODE == "full":
+    # Load demo file
+    df_demo_loaded = read_demo(output_path, schema="Weights_Long")
 
-df_merged = df_merged.rename(columns={
-    "Date_x": "Date_demo",
-    "Date_y": "Date_real"
-})
+    # Real→demo mapping
+    mapping = date_map[["Date", "date_demo"]].drop_duplicates()
+
+    # Reverse lookup demo → real to recover real dates in the demo export
+    df_merged = df_demo_loaded.rename(columns={"Date": "Date_demo"})
+    df_merged["Date_real"] = apply_date_map(
+        df_merged["Date_demo"], mapping, src="date_demo", dst="Date"
+    )
+else:
+    # The export is still in memory: relabel it in place
+    df_export.rename(columns={"Date": "Date_demo"}, inplace=True)
+    df_export["Date_real"] = real_dates.to_numpy()
+    df_merged = df_export
 
 # Build unique pairs
 unique_pairs = (
@@ -136,29 +191,39 @@ unique_pairs = (
 # Export multi-sheet Excel verification
 expost_path = f"Weights_DEMO_DATE_SHIFT_EXPOST_{TS}.xlsx"
 
-with pd.ExcelWriter(expost_path, engine="xlsxwriter") as writer:
-    
-    # 1. All rows with real and fake dates
-    df_merged.to_excel(writer, sheet_name="AllRows", index=False)
-    
-    # 2. Unique date pairs
-    unique_pairs.to_excel(writer, sheet_name="UniquePairs", index=False)
-    
-    # 3. Unique real dates only
-    (
-        df_merged[["Date_real"]]
-        .drop_duplicates()
-        .sort_values("Date_real")
-        .to_excel(writer, sheet_name="RealDates", index=False)
-    )
-    
-    # 4. Unique demo dates only
-    (
-        df_merged[["Date_demo"]]
-        .drop_duplicates()
-        .sort_values("Date_demo")
-        .to_excel(writer, sheet_name="DemoDates", index=False)
-    )
+# All rows go to the columnar side file; Excel gets the summaries only
+expost_detail_path = f"Weights_DEMO_DATE_SHIFT_EXPOST_AllRows_{TS}.{REPORT_DETAIL_FORMAT}"
+
+write_report(
+    expost_path,
+    {
+        # 1. Unique date pairs
+        "UniquePairs": unique_pairs,
+
+        # 2. Unique real dates only
+        "RealDates": (
+            df_merged[["Date_real"]]
+            .drop_duplicates()
+            .sort_values("Date_real")
+        ),
+
+        # 3. Unique demo dates only
+        "DemoDates": (
+            df_merged[["Date_demo"]]
+            .drop_duplicates()
+            .sort_values("Date_demo")
+        ),
+
+        # 4. Checks and per-date row counts / hashes
+        "Checks": checks,
+        "PerDate": verifier.per_date(),
+    },
+    detail=df_merged,
+    detail_path=expost_detail_path,
+)
 
 print(f"\nEX-POST verification exported → {expost_path}")
+print(f"Row-level detail exported → {expost_detail_path}")
+
+run_log.write()
 print("\nAll done.")
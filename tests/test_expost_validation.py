@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ex_post_date_validations_alpha_wgts_prox import (check_business_days_canonical, reconcile_mappings,
+                                                      validate_sources, validation_summary)
+
+
+def _write_long(path, dates):
+    pd.DataFrame({
+        "BarraId": np.repeat(["A", "B"], len(dates)),
+        "Date": np.tile(pd.DatetimeIndex(dates).strftime("%Y-%m-%d"), 2),
+        "Value": np.arange(2 * len(dates), dtype=float),
+    }).to_csv(path, index=False)
+
+
+def test_unreadable_source_fails_without_running_checks(tmp_path, capsys):
+    good = tmp_path / "good.csv.gz"
+    _write_long(good, pd.bdate_range("2025-01-01", periods=10))
+    sources = [{"name": "Good", "path": str(good)},
+               {"name": "Missing", "path": str(tmp_path / "missing.csv.gz")}]
+
+    good_result, missing = validate_sources(sources, workers=2, chunksize=7)
+    printed = capsys.readouterr().out
+
+    assert good_result["ok"] and good_result["rows"] == 20 and good_result["error"] is None
+    assert not missing["ok"] and "FileNotFoundError" in missing["error"]
+    checks = missing["bizday_check"].set_index("Check")["Result"]
+    assert "Error" in checks and not checks["All weekdays (Mon-Fri)"]
+    assert not checks["Sequence matches continuous BD range"]
+    # The printed report of the failed source runs no checks
+    report = printed.split("EXPOST VALIDATION: Missing")[1]
+    assert "No missing business days" not in report and "True" not in report
+
+    summary = validation_summary([good_result, missing])
+    assert not summary["ok"] and summary["failed"] == ["Missing"]
+
+
+def _bdate_baseline(dates):
+    """
+    The original check: the dates against pd.bdate_range(first, last).
+    """
+    dates = pd.DatetimeIndex(dates)
+    b_range = pd.bdate_range(dates.min(), dates.max())
+    return {
+        "expected": len(b_range),
+        "missing": len(set(b_range) - set(dates)),
+        "sequence_ok": set(b_range) == set(dates),
+    }
+
+
+def _check(dates):
+    checks = check_business_days_canonical(pd.Series(pd.DatetimeIndex(dates)), "x")
+    checks = checks.set_index("Check")["Result"]
+    return {
+        "expected": checks["Expected business days"],
+        "missing": checks["Missing business days (count)"],
+        "sequence_ok": checks["Sequence matches continuous BD range"],
+    }
+
+
+@pytest.mark.parametrize("dates", [
+    ["2024-01-06", "2024-01-09", "2024-01-10"],     # starts on a Saturday
+    ["2024-01-02", "2024-01-03", "2024-01-06"],     # ends on a Saturday
+])
+def test_business_days_weekend_endpoints(dates, capsys):
+    assert _check(dates) == _bdate_baseline(dates)
+
+
+def test_business_days_match_bdate_range(capsys):
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        days = pd.date_range("2024-01-01", periods=rng.integers(1, 40))
+        dates = days[rng.random(len(days)) < rng.random()]
+        if len(dates):
+            assert _check(dates) == _bdate_baseline(dates), list(dates.date)
+
+
+def test_reconcile_mappings():
+    def dataset(prefix, dates):
+        dates = pd.DatetimeIndex(dates)
+        return {"prefix": prefix,
+                "mapping": pd.DataFrame({"Real_Index": np.arange(len(dates)), "Date_demo": dates})}
+
+    days = pd.bdate_range("2025-01-01", periods=8)
+    result = reconcile_mappings([
+        dataset("A", days),
+        dataset("B", days[:5]),
+        dataset("C", days.delete([2, 3])),
+    ])
+
+    table = result["table"]
+    assert list(table["Date_demo"]) == list(days)
+    assert list(table["Presence"]) == [7, 7, 3, 3, 7, 5, 5, 5]
+    assert list(table["Sources"]) == [3, 3, 2, 2, 3, 2, 2, 2]
+    assert table["B_Real_Index"].isna().sum() == 3
+    assert list(table["C_Real_Index"].dropna()) == list(range(6))
+
+    divergence = result["first_divergence"]
+    assert divergence["index"] == 2 and divergence["date"] == days[2]
+    assert divergence["missing_from"] == ["C"]
+
+    sources = result["sources"].set_index("Source")
+    assert sources.loc["A", "Missing ranges"] == "None"
+    assert sources.loc["B", "Missing (of union)"] == 3
+    assert sources.loc["C", "Missing (of union)"] == 2 and len(sources.loc["C", "Missing ranges"]) == 1
+
+    same = reconcile_mappings([dataset("A", days), dataset("B", days)])
+    assert same["first_divergence"] is None
@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+from pandas.tseries.offsets import BDay
+
+from demo_incremental import incremental_rebase
+from demo_rebase import stream_rebase
+from demo_verify import ExportVerifier
+
+
+def _write_long(path, dates, bump=None):
+    """
+    Two securities per date; bump (a date) changes that date's values.
+    """
+    dates = pd.DatetimeIndex(dates)
+    df = pd.DataFrame({
+        "BarraId": np.tile(["A", "B"], len(dates)),
+        "Date": np.repeat(dates.strftime("%Y-%m-%d"), 2),
+        "Value": np.arange(2 * len(dates), dtype=float),
+    })
+    if bump is not None:
+        df.loc[df["Date"] == pd.Timestamp(bump).strftime("%Y-%m-%d"), "Value"] += 0.5
+    df.to_csv(path, index=False)
+
+
+def _read_export(path):
+    return pd.read_csv(path).sort_values(["Date", "BarraId"]).reset_index(drop=True)
+
+
+def _fresh(tmp_path, path, date_map):
+    """
+    The same input and date map through a plain streaming rebase.
+    """
+    out = tmp_path / "fresh.csv.gz"
+    stream_rebase(path, out, date_map, chunksize=7, verifier=ExportVerifier(date_map))
+    return _read_export(out)
+
+
+def test_full_append_rewrite_into_the_previous_export(tmp_path):
+    src = tmp_path / "long.csv"
+    out = str(tmp_path / "demo.csv.gz")
+    manifest = str(tmp_path / "manifest.json")
+    dates = pd.bdate_range("2025-01-01", periods=40)
+
+    # Full: no manifest yet
+    _write_long(src, dates[:30])
+    real_end = dates[29]
+    date_map, verifier, stats = incremental_rebase(src, out, manifest, real_end,
+                                                   real_end + BDay(300), chunksize=7)
+    assert stats["mode"] == "full" and verifier.ok()
+    pdt.assert_frame_equal(_read_export(out), _fresh(tmp_path, src, date_map))
+
+    # Append: new dates, REAL_END and DEMO_END advance together
+    _write_long(src, dates)
+    real_end = dates[-1]
+    demo_end = real_end + BDay(300)
+    date_map, verifier, stats = incremental_rebase(src, out, manifest, real_end, demo_end,
+                                                   chunksize=7)
+    assert stats["mode"] == "append" and verifier.ok()
+    assert stats["new_dates"] == 10 and stats["rows_carried"] == 60 and stats["rows_rebased"] == 20
+    pdt.assert_frame_equal(_read_export(out), _fresh(tmp_path, src, date_map))
+
+    # Rewrite: one old date changed, same DEMO_END
+    _write_long(src, dates, bump=dates[5])
+    date_map, verifier, stats = incremental_rebase(src, out, manifest, real_end, demo_end,
+                                                   chunksize=7)
+    assert stats["mode"] == "rewrite" and verifier.ok()
+    assert stats["changed_dates"] == 1 and stats["rows_rebased"] == 2
+    pdt.assert_frame_equal(_read_export(out), _fresh(tmp_path, src, date_map))
+    assert not [f for f in os.listdir(tmp_path) if f.startswith(".")]   # no staging file left
+    with open(manifest) as fh:
+        assert os.path.abspath(json.load(fh)["export"]) == os.path.abspath(out)
+
+
+def test_failed_append_leaves_the_previous_export(tmp_path, monkeypatch):
+    src = tmp_path / "long.csv"
+    out = str(tmp_path / "demo.csv.gz")
+    manifest = str(tmp_path / "manifest.json")
+    dates = pd.bdate_range("2025-01-01", periods=12)
+
+    _write_long(src, dates[:10])
+    incremental_rebase(src, out, manifest, dates[9], dates[9] + BDay(300), chunksize=7)
+    size = os.path.getsize(out)
+    with open(manifest) as fh:
+        before = fh.read()
+
+    monkeypatch.setattr(ExportVerifier, "ok", lambda self: False)
+    _write_long(src, dates)
+    _, _, stats = incremental_rebase(src, out, manifest, dates[-1], dates[-1] + BDay(300),
+                                     chunksize=7)
+    assert stats["mode"] == "append"
+    assert os.path.getsize(out) == size
+    with open(manifest) as fh:
+        assert fh.read() == before
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from demo_proximity import convert_proximity, open_proximity
+
+
+def test_text_dates_are_parsed(tmp_path):
+    # Dates stored as text in the workbook ("MM/DD/YYYY"), out of order
+    days = pd.bdate_range("2024-12-30", periods=6)
+    order = [3, 0, 5, 1, 4, 2]
+    frame = pd.DataFrame({
+        "BarraId": "USA0001",
+        "Date": [days[i].strftime("%m/%d/%Y") for i in order],
+        "ContextualVarGroup": "SIZE",
+        "value": np.arange(6, dtype=float),
+    })
+    xlsx = tmp_path / "Proximity Data.xlsx"
+    frame.to_excel(xlsx, index=False)
+
+    convert_proximity(xlsx)
+    df = open_proximity(xlsx).read()
+
+    assert df["Date"].dtype.kind == "M"
+    assert list(df["Date"]) == list(days)
+    assert list(df["value"]) == [float(order.index(i)) for i in range(6)]
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from viz_proximity import decimate_minmax
+
+
+def _series(unit, n=4000, seed=0):
+    index = pd.bdate_range("2010-01-01", periods=n).as_unit(unit)
+    return pd.Series(np.random.default_rng(seed).normal(size=n), index=index)
+
+
+def _bucket_extremes(series, buckets):
+    # Exact reference with Python integers (no overflow)
+    x = [int(v) for v in series.index.as_unit("ns").asi8]
+    span = max(x[-1] - x[0], 1)
+    bucket = [min((v - x[0]) * buckets // span, buckets - 1) for v in x]
+    frame = pd.DataFrame({"bucket": bucket, "y": series.to_numpy()})
+    return set(frame.groupby("bucket")["y"].min()) | set(frame.groupby("bucket")["y"].max())
+
+
+@pytest.mark.parametrize("unit", ["ns", "us", "s"])
+def test_keeps_every_bucket_extreme(unit):
+    series = _series(unit)            # ~15 years of business days
+    out = decimate_minmax(series, buckets=1000)
+
+    assert len(out) <= 2 * 1000 + 2
+    assert out.index.is_monotonic_increasing
+    assert out.index[0] == series.index[0] and out.index[-1] == series.index[-1]
+    assert _bucket_extremes(series, 1000) <= set(out.to_numpy())
+
+
+def test_ns_index_matches_coarser_units():
+    # (x - x[0]) * buckets overflowed int64 on a multi-year ns index
+    kept = {unit: decimate_minmax(_series(unit), buckets=1000).to_numpy()
+            for unit in ["ns", "us", "s"]}
+    assert len(kept["ns"]) > 1000
+    np.testing.assert_array_equal(kept["ns"], kept["s"])
+    np.testing.assert_array_equal(kept["ns"], kept["us"])
+
+
+def test_short_series_returned_as_is():
+    series = _series("ns", n=50)
+    assert decimate_minmax(series, buckets=1000) is series
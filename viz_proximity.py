@@ -6,70 +6,227 @@ Created on Mon Nov 17 02:16:25 2025
 @author: billyeskel
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-# Load data
-df = pd.read_excel("/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Proximity Data.xlsx")
-df['Date'] = pd.to_datetime(df['Date'])
+import numpy as np
+
+from demo_io import TASK_COLUMNS
+from demo_proximity import SecurityPanels, open_proximity
+
+PROXIMITY_XLSX = "/Users/billyeskel/var/outputs/pwbi_dyn/demo_shift/official/Proximity Data.xlsx"
+COLUMNS = TASK_COLUMNS["trellis"]
 
 # Pick your desired BarraIds
 barra_ids = ["USA2HB1", "USAA681"]
 
+# Batch mode: render headless (Agg) to OUTPUT_DIR instead of showing
+# each chart. BATCH_IDS = None renders every security in the file.
+BATCH = False
+BATCH_IDS = None
+OUTPUT_DIR = "proximity_trellis"
+OUTPUT_FORMAT = "png"          # "png" or "pdf"
+RENDER_WORKERS = 4
+DPI = 100
+
+# Reduce each series to the min and max of every horizontal pixel
+# column before drawing; peaks and the y-limits stay exact
+DECIMATE = False
+FIGSIZE = (10, 8)
+
+vars_order = ["DIVYILD", "SIZE", "SpeRisk"]
+
+
 # -----------------------------------------------------------------------------
-# Smart scaling function (positive/negative split with padding)
+# Min/max decimation
 # -----------------------------------------------------------------------------
-def smart_scale(series):
-    smin = series.min()
-    smax = series.max()
+def decimate_minmax(series, buckets=int(FIGSIZE[0] * DPI)):
+    """
+    The points of series (sorted by its DatetimeIndex) that are the
+    minimum or maximum of their x bucket, plus the first and last point.
+    At most 2 * buckets + 2 points; every local extreme the plot could
+    show at that width is kept.
+    """
+    n = len(series)
+    if n <= 2 * buckets:
+        return series
+
+    x = series.index.asi8
+    y = series.to_numpy()
+    span = max(x[-1] - x[0], 1)
+    # In float64: (x - x[0]) * buckets overflows int64 for a ns index
+    # spanning more than a few months
+    bucket = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    # Sorted by (bucket, y): the first row of a bucket is its min, the last its max
+    order = np.lexsort((y, bucket))
+    sorted_bucket = bucket[order]
+    first = np.flatnonzero(np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+
+    keep = np.unique(np.r_[order[first], order[last], 0, n - 1])
+    return series.iloc[keep]
 
-    # Entirely negative
-    if smax <= 0:
-        ymin = smin * 1.10     # expand downward
-        ymax = smax * 0.90     # lift slightly toward 0
-        return ymin, ymax
 
-    # Entirely positive
-    if smin >= 0:
-        ymin = smin * 0.90     # pull slightly toward 0
-        ymax = smax * 1.10     # expand upward
-        return ymin, ymax
+# -----------------------------------------------------------------------------
+# Batch rendering (headless, process pool)
+# -----------------------------------------------------------------------------
+class TrellisFigure:
+    """
+    One Agg figure with n stacked panels, reused for every security
+    with n variables: only the line data, limits and titles change.
+    """
+
+    def __init__(self, n):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=FIGSIZE)
+        FigureCanvasAgg(self.fig)
+        self.axes = np.atleast_1d(self.fig.subplots(n, 1, sharex=True))
+        self.lines = []
+        for ax in self.axes:
+            ax.xaxis_date()
+            ax.set_ylabel("Value")
+            self.lines.append(ax.plot([], [])[0])
+        self.axes[-1].set_xlabel("Date")
+        self.title = self.fig.suptitle("")
+        self.laid_out = False
+
+    def render(self, bid, pivot, vars_present, limits, path):
+        import matplotlib.dates as mdates
+
+        self.title.set_text(f"Trellis Time Series for {bid}")
+        for ax, line, var in zip(self.axes, self.lines, vars_present):
+            series = pivot[var].dropna()
+            if DECIMATE:
+                series = decimate_minmax(series)
+            line.set_data(mdates.date2num(series.index), series.to_numpy())
+            ax.set_ylim(*limits.loc[(bid, var)])
+            ax.set_title(var)
+            ax.relim()
+            ax.autoscale_view(scaley=False)
+
+        if not self.laid_out:
+            self.fig.tight_layout()
+            self.laid_out = True
+        self.fig.savefig(path, dpi=DPI)
+
+
+def render_securities(xlsx_path, bids, limits, output_dir, fmt):
+    """
+    Process-pool worker: render the trellis of each id in bids to
+    output_dir, reusing one figure per panel count. Returns the paths.
+    """
+    df = open_proximity(xlsx_path).read(bids, columns=COLUMNS)
+    panels = SecurityPanels(df)
+    figures = {}
+    paths = []
+
+    for bid in bids:
+        if bid not in panels:
+            continue
+        pivot = panels.pivot(bid)
+        vars_present = [v for v in vars_order if v in pivot.columns]
+        if not vars_present:
+            continue
+
+        n = len(vars_present)
+        if n not in figures:
+            figures[n] = TrellisFigure(n)
+
+        path = os.path.join(output_dir, f"{bid}_trellis.{fmt}")
+        figures[n].render(bid, pivot, vars_present, limits, path)
+        paths.append(path)
+
+    return paths
+
+
+def render_batch(xlsx_path, bids=None, output_dir=OUTPUT_DIR, fmt=OUTPUT_FORMAT,
+                 workers=RENDER_WORKERS):
+    """
+    Render the trellis of every id in bids (None = all) to output_dir,
+    spread over worker processes. Y-limits come from the store's cached
+    smart-scale table.
+    """
+    store = open_proximity(xlsx_path)
+    bids = store.barra_ids() if bids is None else list(bids)
+    limits = store.scale_table()
+    os.makedirs(output_dir, exist_ok=True)
+
+    if workers > 1:
+        # A few batches per worker keeps the processes evenly loaded
+        n_batches = max(1, min(len(bids), workers * 4))
+        batches = [bids[i::n_batches] for i in range(n_batches)]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(render_securities, xlsx_path, batch,
+                            limits.loc[limits.index.get_level_values("BarraId").isin(batch)],
+                            output_dir, fmt)
+                for batch in batches
+            ]
+            paths = [p for f in futures for p in f.result()]
+    else:
+        paths = render_securities(xlsx_path, bids, limits, output_dir, fmt)
+
+    print(f"Rendered {len(paths):,} trellis charts → {output_dir}")
+    return paths
 
-    # Crosses zero → use symmetrical range
-    return -1, 1
 
 # -----------------------------------------------------------------------------
-# Plot each BarraId
+# Interactive: plot each BarraId
 # -----------------------------------------------------------------------------
-for bid in barra_ids:
-    sub = df[df["BarraId"] == bid]
-    pivot = sub.pivot(index="Date", columns="ContextualVarGroup", values="value")
-    
-    vars_order = ["DIVYILD", "SIZE", "SpeRisk"]
-    vars_present = [v for v in vars_order if v in pivot.columns]
+def show_interactive(xlsx_path, bids):
+    import matplotlib.pyplot as plt
+
+    # Load data
+    # (memory-mapped store next to the xlsx, built on first use and rebuilt
+    # when the xlsx changes; only the picked BarraIds and plotted columns
+    # are read)
+    store = open_proximity(xlsx_path)
+    df = store.read(bids, columns=COLUMNS)
+
+    # One pivot for all securities; each security is then a row slice
+    panels = SecurityPanels(df)
+
+    # Smart y-limits of every series (positive/negative split with padding)
+    limits = store.scale_table()
+
+    for bid in bids:
+        if bid not in panels:
+            print(f"No proximity data for {bid}")
+            continue
+        pivot = panels.pivot(bid)
+
+        vars_present = [v for v in vars_order if v in pivot.columns]
 
-    fig, axes = plt.subplots(len(vars_present), 1, figsize=(10, 8), sharex=True)
-    if len(vars_present) == 1:
-        axes = [axes]
+        fig, axes = plt.subplots(len(vars_present), 1, figsize=FIGSIZE, sharex=True)
+        if len(vars_present) == 1:
+            axes = [axes]
 
-    fig.suptitle(f"Trellis Time Series for {bid}")
+        fig.suptitle(f"Trellis Time Series for {bid}")
 
-    for ax, var in zip(axes, vars_present):
+        for ax, var in zip(axes, vars_present):
 
-        series = pivot[var].dropna()
+            series = pivot[var].dropna()
+            if DECIMATE:
+                series = decimate_minmax(series)
 
-        # Get smart scale
-        ymin, ymax = smart_scale(series)
+            ymin, ymax = limits.loc[(bid, var)]
+            ax.set_ylim(ymin, ymax)
 
-        # Guarantee ymin < ymax
-        ymin, ymax = min(ymin, ymax), max(ymin, ymax)
+            ax.plot(series.index, series)
+            ax.set_title(var)
+            ax.set_ylabel("Value")
 
-        ax.set_ylim(ymin, ymax)
+        axes[-1].set_xlabel("Date")
+        plt.tight_layout()
+        plt.show()
 
-        ax.plot(series.index, series)
-        ax.set_title(var)
-        ax.set_ylabel("Value")
 
-    axes[-1].set_xlabel("Date")
-    plt.tight_layout()
-    plt.show()
+if __name__ == "__main__":
+    if BATCH:
+        render_batch(PROXIMITY_XLSX, BATCH_IDS)
+    else:
+        show_interactive(PROXIMITY_XLSX, barra_ids)